@@ -0,0 +1,55 @@
+import os
+import tempfile
+import time
+import numpy as np
+from utils.audio_io import AudioSink, file_blocks
+
+RATE = 44100
+DURATION = 60
+BLOCK = 1024
+FORMATS = [".wav", ".flac", ".ogg"]
+
+def voice_like(rng):
+    # A gliding harmonic tone with pauses and a little room noise, closer
+    # to a practice recording than white noise or a pure sine.
+    t = np.arange(RATE * DURATION) / RATE
+    f0 = 220 * 2 ** (np.sin(2 * np.pi * 0.1 * t) / 2)
+    phase = 2 * np.cumsum(np.pi * f0 / RATE)
+    tone = sum(np.sin(k * phase) / k for k in range(1, 6))
+    gate = (np.sin(2 * np.pi * 0.25 * t) > -0.3).astype(float)
+    signal = 0.25 * tone * gate + 0.003 * rng.standard_normal(len(t))
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+def write(path, samples):
+    # Blocks are pushed as fast as the sink accepts them, so the wall time
+    # is the encoder's throughput rather than the recording length.
+    start = time.perf_counter()
+    sink = AudioSink(path, RATE)
+    for i in range(0, len(samples), BLOCK):
+        sink.write(samples[i:i + BLOCK].tobytes())
+    sink.close()
+    return time.perf_counter() - start
+
+def read(path):
+    start = time.perf_counter()
+    frames = sum(block.shape[-1] for block in file_blocks(path))
+    return time.perf_counter() - start, frames
+
+def main():
+    samples = voice_like(np.random.default_rng(0))
+    print(f"{DURATION} s mono at {RATE} Hz in {BLOCK}-frame blocks")
+    print(f"{'format':>6} {'bytes':>10} {'vs wav':>7} {'write s':>8} {'x realtime':>10} {'read s':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        wav_bytes = None
+        for extension in FORMATS:
+            path = os.path.join(directory, "recording" + extension)
+            wall = write(path, samples)
+            size = os.path.getsize(path)
+            wav_bytes = wav_bytes or size
+            read_wall, frames = read(path)
+            assert abs(frames - len(samples)) < RATE
+            print(f"{extension[1:]:>6} {size:>10} {size / wav_bytes:>7.2f} {wall:>8.3f} {DURATION / wall:>10.0f} "
+                  f"{read_wall:>7.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+from gui.pitch_visualizer import PitchVisualizer, RECORD_RATE
+from utils.audio_player import NullBackend
+from utils.replay_stream import ReplayStream
+
+PHASE_SECONDS = 5
+
+def tone(freq=440.0, seconds=2.0):
+    t = np.arange(int(RECORD_RATE * seconds)) / RECORD_RATE
+    return 0.5 * np.sin(2 * np.pi * freq * t)
+
+def main():
+    app = PitchVisualizer(stream_factory=lambda: ReplayStream(tone(), RECORD_RATE), player_backend=NullBackend())
+    results = {}
+
+    def measure(name):
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        time.sleep(PHASE_SECONDS)
+        results[name] = 100 * (time.process_time() - cpu) / (time.perf_counter() - wall)
+
+    def script():
+        time.sleep(1)
+        measure("idle")
+        app.start_recording()
+        time.sleep(1)
+        measure("detecting")
+        app.stop_recording()
+        time.sleep(1)
+        measure("idle after detecting")
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    threading.Thread(target=script, daemon=True).start()
+    try:
+        app.run()
+    except SystemExit:
+        pass
+
+    print(f"{'phase':>22} {'process CPU %':>14}")
+    for name, cpu in results.items():
+        print(f"{name:>22} {cpu:>14.1f}")
+
+if __name__ == "__main__":
+    main()
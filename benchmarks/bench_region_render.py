@@ -0,0 +1,43 @@
+import time
+import numpy as np
+from benchmarks.bench_audio_sink import voice_like, RATE, DURATION
+from models.effect_graph import PRESETS
+from models.pitch_shifter import PitchShifter
+from models.region_render import RegionRender
+
+EDIT_SECONDS = (0.1, 1, 5)
+EXTEND_SECONDS = 5
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+def renderers(shifter):
+    return {
+        "shift +3": RegionRender.for_shift(shifter, 3),
+        "chorus": RegionRender.for_preset(PRESETS["chorus"], shifter, RATE, shift=0),
+    }
+
+def main():
+    y = voice_like(np.random.default_rng(0)) / 32768
+    shifter = PitchShifter()
+    middle = len(y) // 2
+    print(f"{DURATION} s take; an edit re-renders [start, end) plus padding")
+    print(f"{'effect':>9} {'edit':>12} {'full s':>7} {'region s':>9} {'speedup':>8}")
+    for name, renderer in renderers(shifter).items():
+        full = timed(renderer.render, y)
+        for seconds in EDIT_SECONDS:
+            start, end = middle, middle + int(seconds * RATE)
+            edited = y.copy()
+            edited[start:end] *= 0.5
+            region = timed(renderer.update, edited, start, end)
+            print(f"{name:>9} {f'{seconds:g} s gain':>12} {full:>7.2f} {region:>9.3f} {full / region:>8.0f}")
+
+        # Extending the take re-renders from just before the old end.
+        renderer.render(y[:-EXTEND_SECONDS * RATE])
+        region = timed(renderer.update, y, len(y) - EXTEND_SECONDS * RATE, len(y))
+        print(f"{name:>9} {f'+{EXTEND_SECONDS} s take':>12} {full:>7.2f} {region:>9.3f} {full / region:>8.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import time
+import numpy as np
+from models.resampler import PolyphaseResampler, filter_bank
+
+RATE = 44100
+DURATION = 10
+BLOCK = 1024
+SEMITONES = [-12, -3.02, 0.12, 3.98, 7.02, 12]
+TEST_FREQS = [110, 440, 1760, 7040]
+EDGE = 512
+
+def snr_db(reference, estimate):
+    err = estimate - reference
+    with np.errstate(divide="ignore"):
+        return 10 * np.log10(np.sum(reference ** 2) / np.sum(err ** 2))
+
+def accuracy(resampler, freq):
+    ratio = resampler.up / resampler.down
+    x = np.sin(2 * np.pi * freq * np.arange(RATE) / RATE)
+    y = resampler.resample(x)
+    reference = np.sin(2 * np.pi * freq * np.arange(len(y)) / (RATE * ratio))
+    linear = np.interp(np.arange(len(y)) / ratio, np.arange(len(x)), x)
+    keep = slice(EDGE, len(y) - EDGE)
+    return snr_db(reference[keep], y[keep]), snr_db(reference[keep], linear[keep])
+
+def throughput(resampler, x):
+    start = time.perf_counter()
+    resampler.resample(x)
+    whole = len(x) / (time.perf_counter() - start)
+
+    resampler.reset()
+    start = time.perf_counter()
+    for i in range(0, len(x), BLOCK):
+        resampler.process(x[i:i + BLOCK])
+    resampler.flush()
+    blocks = len(x) / (time.perf_counter() - start)
+    resampler.reset()
+    return whole, blocks
+
+def main():
+    x = np.random.default_rng(0).standard_normal(RATE * DURATION)
+    print(f"{'semitones':>9} {'up/down':>9} {'taps':>5} {'design ms':>9} {'whole Ms/s':>10} "
+          f"{'block Ms/s':>10} {'SNR dB (min over freqs)':>24} {'linear SNR dB':>13}")
+    for semitones in SEMITONES:
+        filter_bank.cache_clear()
+        start = time.perf_counter()
+        resampler = PolyphaseResampler.for_ratio(2 ** (-semitones / 12))
+        design_ms = (time.perf_counter() - start) * 1000
+        whole, blocks = throughput(resampler, x)
+        snrs = [accuracy(resampler, freq) for freq in TEST_FREQS if freq < RATE / 2 * min(1, resampler.up / resampler.down)]
+        print(f"{semitones:>9} {f'{resampler.up}/{resampler.down}':>9} {resampler.taps:>5} {design_ms:>9.2f} "
+              f"{whole / 1e6:>10.2f} {blocks / 1e6:>10.2f} {min(s for s, _ in snrs):>24.1f} "
+              f"{min(s for _, s in snrs):>13.1f}")
+
+if __name__ == "__main__":
+    main()
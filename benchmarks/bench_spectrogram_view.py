@@ -0,0 +1,52 @@
+import os
+import time
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+from gui.spectrogram_view import SpectrogramView
+
+RATE = 44100
+CHUNK = 1024 * 4
+WIDTH = 700
+HEIGHT = 120
+MAX_FREQ = 4200
+HISTORY_LENGTHS = [700, 2048, 16384, 131072]
+FRAMES = 2000
+
+def full_redraw(screen, history, palette):
+    # What redrawing the whole visible history every frame would cost.
+    visible = history[-WIDTH:]
+    surface = pygame.surfarray.make_surface(palette[visible])
+    screen.blit(surface, (0, 0))
+
+def main():
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH + 100, HEIGHT + 100))
+    freqs = RATE / CHUNK * np.arange(CHUNK // 2)
+    rng = np.random.default_rng(0)
+    spectra = rng.random((64, CHUNK // 2))
+    pitches = rng.uniform(80, 1000, 64)
+
+    print(f"{'history':>8} {'push+draw ms/frame':>18} {'p99 ms':>7} {'full redraw ms/frame':>20}")
+    for history in HISTORY_LENGTHS:
+        view = SpectrogramView(50, 50, WIDTH, HEIGHT, MAX_FREQ, history=history)
+        times = []
+        for i in range(FRAMES):
+            start = time.perf_counter()
+            view.push((freqs, spectra[i % 64]), pitches[i % 64])
+            view.draw(screen)
+            times.append(time.perf_counter() - start)
+
+        ordered = np.roll(view.history, -view.write_index, axis=0)
+        start = time.perf_counter()
+        for _ in range(100):
+            full_redraw(screen, ordered, view.palette)
+        redraw = (time.perf_counter() - start) / 100
+
+        times = np.array(times) * 1000
+        print(f"{history:>8} {np.mean(times):>18.3f} {np.percentile(times, 99):>7.3f} {redraw * 1000:>20.3f}")
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import argparse
+import time
+import numpy as np
+from benchmarks.bench_audio_sink import voice_like, RATE
+from models.multi_resolution_detector import MultiResolutionPitchDetector
+from models.pitch_tracker import track_pitch, FRAME, HOP
+from utils.pitch_data import get_closest_note
+
+LOOP_FRAMES = 2000
+
+def per_frame(y, count):
+    # The chunk-at-a-time path: one FFT and one note lookup per frame.
+    detector = MultiResolutionPitchDetector(sizes=(FRAME,), hop=HOP, rate=RATE)
+    for i in range(count):
+        detector.write(y[i * HOP:i * HOP + FRAME] / 32768)
+        freq, _, _ = detector.estimate(FRAME)
+        get_closest_note(freq)
+
+def main():
+    parser = argparse.ArgumentParser(description="Whole-file pitch tracking throughput")
+    parser.add_argument("--minutes", type=float, default=60)
+    args = parser.parse_args()
+
+    minute = voice_like(np.random.default_rng(0))
+    y = np.tile(minute, int(np.ceil(args.minutes * RATE * 60 / len(minute))))[:int(args.minutes * RATE * 60)]
+    print(f"{args.minutes:g} min int16 mono at {RATE} Hz, frame {FRAME}, hop {HOP}")
+
+    start = time.perf_counter()
+    times, freqs, notes = track_pitch(y, RATE)
+    wall = time.perf_counter() - start
+    print(f"{'track_pitch':>12}: {len(times)} frames in {wall:.2f} s, {len(times) / wall:,.0f} frames/s, "
+          f"{args.minutes * 60 / wall:.0f}x realtime, {np.count_nonzero(~np.isnan(freqs))} voiced")
+
+    start = time.perf_counter()
+    per_frame(y, LOOP_FRAMES)
+    wall = time.perf_counter() - start
+    print(f"{'per frame':>12}: {LOOP_FRAMES} frames in {wall:.2f} s, {LOOP_FRAMES / wall:,.0f} frames/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from models.pitch_service import HOST, HOP
+
+RATE = 44100
+DURATION = 5.0
+LEVELS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+LATENCY_BUDGET = HOP / RATE
+PORT = 8766
+GATING_HOPS = (4, 10, 10)
+
+def server_cpu_seconds(pid):
+    # utime + stime from /proc; None where that is not available.
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def client_signal(index, hops):
+    rng = np.random.default_rng(index)
+    freq = 110 * 2 ** (index % 36 / 12)
+    t = np.arange(hops * HOP) / RATE
+    signal = 8000 * np.sin(2 * np.pi * freq * t) + 30 * rng.standard_normal(len(t))
+    return signal.astype("<i2").tobytes()
+
+def gated_signal(silent, voiced, trailing):
+    # Silence, a tone and silence again, for checking the VAD gate across
+    # an onset and an offset.
+    t = np.arange(voiced * HOP) / RATE
+    tone = 8000 * np.sin(2 * np.pi * 220 * t)
+    signal = np.concatenate((np.zeros(silent * HOP), tone, np.zeros(trailing * HOP)))
+    signal += 30 * np.random.default_rng(0).standard_normal(len(signal))
+    return signal.astype("<i2").tobytes()
+
+async def gating_check(host, port, timeout=10.0):
+    # The whole stream goes out in one write, so the server has several hops
+    # queued while the gate opens and closes. Every hop must be answered, and
+    # the connection must close once the client is done.
+    silent, voiced, trailing = GATING_HOPS
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(gated_signal(silent, voiced, trailing))
+    writer.write_eof()
+    replies = []
+    try:
+        while line := await asyncio.wait_for(reader.readline(), timeout):
+            replies.append(json.loads(line))
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+    hops = silent + voiced + trailing
+    notes = [reply["note"] for reply in replies]
+    answered = len(replies) == hops and [reply["hop"] for reply in replies] == list(range(hops))
+    gated = not any(notes[:silent]) and all(notes[silent + 1:silent + voiced])
+    print(f"Gating check: {len(replies)}/{hops} replies, notes {''.join('x' if n else '.' for n in notes)}, "
+          f"{'ok' if answered and gated else 'FAILED'}")
+    return answered and gated
+
+async def run_client(index, host, port, duration, latencies):
+    hops = int(duration * RATE / HOP)
+    data = client_signal(index, hops)
+    reader, writer = await asyncio.open_connection(host, port)
+    sent_at = {}
+    received = 0
+
+    async def receive():
+        nonlocal received
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            reply = json.loads(line)
+            latencies.append(time.perf_counter() - sent_at.pop(reply["hop"]))
+            received += 1
+
+    receiver = asyncio.create_task(receive())
+    # Clients start at random points within a hop, like real microphones.
+    await asyncio.sleep(np.random.default_rng(index).uniform(0, HOP / RATE))
+    start = time.perf_counter()
+    lateness = 0.0
+    for i in range(hops):
+        due = start + (i + 1) * HOP / RATE
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        writer.write(data[i * HOP * 2:(i + 1) * HOP * 2])
+        sent_at[i] = time.perf_counter()
+        await writer.drain()
+        lateness = time.perf_counter() - due
+    writer.write_eof()
+    await receiver
+    writer.close()
+    return received == hops, lateness
+
+async def run_level(streams, host, port, duration):
+    latencies = []
+    results = await asyncio.gather(*(run_client(i, host, port, duration, latencies) for i in range(streams)))
+    complete = all(ok for ok, _ in results)
+    lateness = max(late for _, late in results)
+    return np.array(latencies), complete, lateness
+
+async def wait_for_server(host, port, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return True
+        except OSError:
+            await asyncio.sleep(0.2)
+    return False
+
+async def load_test(host, port, duration, levels, server):
+    if not await wait_for_server(host, port):
+        print("Pitch service did not start")
+        return
+    if not await gating_check(host, port):
+        return
+    print()
+
+    print(f"{'streams':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'late ms':>8} {'server cores':>12} {'ok':>4}")
+    sustained = None
+    for streams in levels:
+        cpu_before = server_cpu_seconds(server.pid) if server else None
+        wall_before = time.perf_counter()
+        latencies, complete, lateness = await run_level(streams, host, port, duration)
+        wall = time.perf_counter() - wall_before
+        cpu_after = server_cpu_seconds(server.pid) if server else None
+        cores = (cpu_after - cpu_before) / wall if cpu_before is not None and cpu_after is not None else None
+
+        p50, p99, worst = np.percentile(latencies, [50, 99, 100]) * 1000 if len(latencies) else (np.nan,) * 3
+        # A level is sustained when every hop got an answer, the senders kept
+        # real-time pace and p99 stays within one hop.
+        ok = complete and lateness < HOP / RATE and p99 / 1000 < LATENCY_BUDGET
+        cores_text = f"{cores:.2f}" if cores is not None else "n/a"
+        print(f"{streams:>7} {p50:>8.1f} {p99:>8.1f} {worst:>8.1f} {lateness * 1000:>8.1f} {cores_text:>12} "
+              f"{'yes' if ok else 'no':>4}")
+        if not ok:
+            break
+        sustained = (streams, p99, cores)
+
+    print()
+    if sustained is None:
+        print("No level was sustained")
+        return
+    streams, p99, cores = sustained
+    print(f"Sustained {streams} streams with p99 latency {p99:.1f} ms (budget {LATENCY_BUDGET * 1000:.1f} ms)")
+    if cores:
+        print(f"{streams / cores:.1f} streams per core ({cores:.2f} cores used by the service)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for models.pitch_service")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--duration", type=float, default=DURATION)
+    parser.add_argument("--external", action="store_true", help="test an already running service")
+    args = parser.parse_args()
+
+    server = None
+    if not args.external:
+        server = subprocess.Popen([sys.executable, "-m", "models.pitch_service", "--host", args.host,
+                                   "--port", str(args.port)])
+    try:
+        asyncio.run(load_test(args.host, args.port, args.duration, LEVELS, server))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
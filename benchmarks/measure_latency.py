@@ -0,0 +1,155 @@
+import argparse
+import os
+import threading
+import time
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+from gui.pitch_visualizer import PitchVisualizer, RECORD_RATE
+from models.effect_graph import EffectGraph, PRESETS
+from models.pitch_shifter import PitchShifter
+from models.real_time_pitch_detector import CHUNK
+from utils.audio_player import NullBackend
+from utils.pitch_data import NOTE_FREQUENCIES
+from utils.replay_stream import ReplayStream
+
+NOTES = ["A2", "E3", "A3", "E4", "A4", "D5", "G3", "B4"]
+TONE = 0.6
+GAP = 0.4
+LEVEL = 0.4
+HARMONICS = 6
+LEAD_IN = 1.0
+INPUT_BUFFER = 2 * CHUNK
+PERCENTILES = (50, 90, 99)
+
+def onset_signal(repeats, rng):
+    # Tones of changing pitch separated by near-silence, so every onset is a
+    # new note on screen. Returns the samples and (onset sample, note) pairs.
+    t = np.arange(int(RECORD_RATE * TONE)) / RECORD_RATE
+    envelope = np.minimum(1, np.minimum(t, TONE - t) / 0.005)
+    parts = [np.zeros(int(RECORD_RATE * LEAD_IN))]
+    onsets = []
+    position = len(parts[0])
+    for note in NOTES * repeats:
+        freq = NOTE_FREQUENCIES[note]
+        partials = sum(np.sin(2 * np.pi * k * freq * t) / k for k in range(1, HARMONICS + 1))
+        onsets.append((position, note))
+        gap = np.zeros(int(RECORD_RATE * GAP))
+        parts += [LEVEL * envelope * partials / HARMONICS, gap]
+        position += len(t) + len(gap)
+    signal = np.concatenate(parts)
+    return signal + 0.001 * rng.standard_normal(len(signal)), onsets
+
+class LatencyProbe:
+    # Installed as PitchVisualizer.latency_probe; the detector thread reports
+    # each analysed hop and the GUI thread each note that reached the screen.
+    # extra_ms stalls the detector thread to provoke input overflows.
+    def __init__(self, extra_ms=0.0):
+        self.analyses = []
+        self.displays = []
+        self.extra_ms = extra_ms
+
+    def analysed(self, note, at):
+        self.analyses.append((at, note))
+        if self.extra_ms:
+            time.sleep(self.extra_ms / 1000)
+
+    def displayed(self, note, at):
+        self.displays.append((at, note))
+
+def first_after(events, note, after, before):
+    return next((at for at, seen in events if after <= at < before and seen == note), None)
+
+def match(probe, stream, onsets):
+    # Capture is when the onset sample reached the replayed "mic"; analysis
+    # is the first hop reporting the new note; display is the first redraw
+    # showing it.
+    rows = []
+    for k, (position, note) in enumerate(onsets):
+        captured = stream.capture_time(position)
+        until = stream.capture_time(onsets[k + 1][0]) if k + 1 < len(onsets) else float("inf")
+        analysed = first_after(probe.analyses, note, captured, until)
+        displayed = first_after(probe.displays, note, analysed, float("inf")) if analysed else None
+        rows.append((captured, analysed, displayed))
+    return rows
+
+def distribution(values):
+    values = np.array([v for v in values if v is not None]) * 1000
+    if len(values) == 0:
+        return "-"
+    stats = "  ".join(f"p{p} {np.percentile(values, p):6.1f}" for p in PERCENTILES)
+    return f"{stats}  max {values.max():6.1f} ms"
+
+def device_clock(player, stop):
+    # Stands in for the output device: pulls one block every block period,
+    # as the PyAudio callback would, so stream voices can run dry.
+    period = player.block / player.rate
+    due = time.perf_counter()
+    while not stop.is_set():
+        player.backend.pump(player.block)
+        due += period
+        time.sleep(max(due - time.perf_counter(), 0))
+
+def playback_load(app, signal):
+    # The chorus preset rendered and fed block by block while detection
+    # runs, as the effect buttons do.
+    graph = EffectGraph.from_preset(PRESETS["chorus"], PitchShifter(), RECORD_RATE, shift=3)
+    voice_id = app.player.open_stream()
+    app.chorus_voice = voice_id
+    for start in range(0, len(signal), 1 << 14):
+        if not app.player.feed(voice_id, graph.process(signal[None, start:start + (1 << 14)]).T):
+            return
+    app.player.feed(voice_id, graph.flush().T)
+    app.player.finish(voice_id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture-to-display latency and xrun counts")
+    parser.add_argument("--repeats", type=int, default=4, help="passes over the note sequence")
+    parser.add_argument("--buffer", type=int, default=INPUT_BUFFER, help="simulated input buffer, frames")
+    parser.add_argument("--extra-ms", type=float, default=0.0, help="stall per analysed hop")
+    parser.add_argument("--no-playback", action="store_true", help="skip the concurrent chorus playback")
+    args = parser.parse_args()
+
+    signal, onsets = onset_signal(args.repeats, np.random.default_rng(0))
+    streams = []
+
+    def stream_factory():
+        streams.append(ReplayStream(signal, RECORD_RATE, loop=False, buffer_frames=args.buffer))
+        return streams[-1]
+
+    app = PitchVisualizer(stream_factory=stream_factory, player_backend=NullBackend())
+    probe = LatencyProbe(args.extra_ms)
+    app.latency_probe = probe
+    stop = threading.Event()
+
+    def script():
+        time.sleep(0.5)
+        if not args.no_playback:
+            threading.Thread(target=device_clock, args=(app.player, stop), daemon=True).start()
+            threading.Thread(target=playback_load, args=(app, signal), daemon=True).start()
+        app.start_recording()
+        time.sleep(len(signal) / RECORD_RATE + 0.5)
+        app.stop_recording()
+        stop.set()
+        pygame.event.post(pygame.event.Event(pygame.QUIT))
+
+    threading.Thread(target=script, daemon=True).start()
+    try:
+        app.run()
+    except SystemExit:
+        pass
+
+    rows = match(probe, streams[0], onsets)
+    detected = [r for r in rows if r[1] is not None]
+    print(f"{len(onsets)} onsets, {len(detected)} detected, hop {app.pitch_detector.hop} frames, "
+          f"input buffer {args.buffer} frames")
+    print(f"{'capture -> analysis':>22}: {distribution([a - c for c, a, _ in detected])}")
+    print(f"{'analysis -> display':>22}: {distribution([d - a for _, a, d in detected if d])}")
+    print(f"{'capture -> display':>22}: {distribution([d - c for c, _, d in detected if d])}")
+    underruns = app.player.underruns()
+    print(f"input overflows {app.input_xruns.overflows} ({streams[0].overflowed} frames lost), "
+          f"playback underruns {underruns['stream']} stream / {underruns['device']} device")
+
+if __name__ == "__main__":
+    main()
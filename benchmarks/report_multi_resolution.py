@@ -0,0 +1,88 @@
+import numpy as np
+from models.multi_resolution_detector import MultiResolutionPitchDetector
+from models.real_time_pitch_detector import analyze_frames, CHUNK, fs
+
+LOW_MIDI = 36
+HIGH_MIDI = 84
+HARMONICS = 6
+LEAD_IN = 0.5
+ONSETS = 8
+TONE = 1.5
+LEVEL = 8000
+NOISE = 30
+HOP = CHUNK // 2
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+def tone(freq, onset, rng):
+    # Silence, then a harmonic tone with 1/k partials, so onset latency
+    # and the choice of window can both be read off one signal.
+    t = np.arange(int(fs * TONE)) / fs
+    partials = sum(np.sin(2 * np.pi * k * freq * t) / k for k in range(1, HARMONICS + 1) if k * freq < fs / 2)
+    signal = np.concatenate((np.zeros(onset), LEVEL * partials / HARMONICS))
+    return signal + NOISE * rng.standard_normal(len(signal))
+
+def cents(estimate, freq):
+    return 1200 * np.log2(estimate / freq)
+
+def summarize(estimates, freq, onset):
+    # estimates is a list of (time the result was available, freq, window).
+    after = [(t, f, n) for t, f, n in estimates if t > onset]
+    correct = [t for t, f, _ in after if abs(cents(f, freq)) < 50]
+    latency = (correct[0] - onset) * 1000 if correct else np.nan
+    steady = [(f, n) for t, f, n in after if t > onset + 0.5]
+    error = np.median([abs(cents(f, freq)) for f, _ in steady])
+    windows = [n for _, n in steady]
+    return latency, error, max(set(windows), key=windows.count)
+
+def average(summaries):
+    latencies = [latency for latency, _, _ in summaries if not np.isnan(latency)]
+    return np.mean(latencies) if latencies else np.nan, np.mean([error for _, error, _ in summaries])
+
+def multi_resolution(signal):
+    detector = MultiResolutionPitchDetector(hop=HOP, rate=fs)
+    estimates = []
+    for start in range(0, len(signal) - HOP + 1, HOP):
+        for result in detector.push(signal[start:start + HOP]):
+            estimates.append(((start + HOP) / fs, result["freq"], result["window"]))
+    return estimates
+
+def fixed_window(signal):
+    estimates = []
+    for start in range(0, len(signal) - CHUNK + 1, CHUNK):
+        _, max_freqs, _, _, _ = analyze_frames(signal[None, start:start + CHUNK])
+        estimates.append(((start + CHUNK) / fs, max(max_freqs[0], 1.0), CHUNK))
+    return estimates
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'note':>5} {'freq':>8} | {'window':>6} {'latency ms':>10} {'|cents|':>8} | "
+          f"{'fixed ms':>8} {'|cents|':>8}")
+    rows = []
+    for midi in range(LOW_MIDI, HIGH_MIDI + 1):
+        freq = 440 * 2 ** ((midi - 69) / 12)
+        # Onsets are spread over one CHUNK so neither detector gains from
+        # the tone happening to start just before one of its frame edges.
+        multi, fixed = [], []
+        for onset in int(fs * LEAD_IN) + np.arange(ONSETS) * CHUNK // ONSETS:
+            signal = tone(freq, onset, rng)
+            multi.append(summarize(multi_resolution(signal), freq, onset / fs))
+            fixed.append(summarize(fixed_window(signal), freq, onset / fs))
+        latency, error = average(multi)
+        fixed_latency, fixed_error = average(fixed)
+        window = multi[0][2]
+        rows.append((latency, error, fixed_latency, fixed_error))
+        name = f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}"
+        print(f"{name:>5} {freq:>8.2f} | {window:>6} {latency:>10.1f} {error:>8.1f} | "
+              f"{fixed_latency:>8.1f} {fixed_error:>8.1f}")
+
+    rows = np.array(rows)
+    print()
+    print(f"median latency: {np.nanmedian(rows[:, 0]):.1f} ms multi-resolution, "
+          f"{np.nanmedian(rows[:, 2]):.1f} ms fixed {CHUNK}")
+    print(f"median |cents| error: {np.median(rows[:, 1]):.1f} multi-resolution, "
+          f"{np.median(rows[:, 3]):.1f} fixed {CHUNK}")
+    print(f"notes detected: {np.count_nonzero(~np.isnan(rows[:, 0]))}/{len(rows)} multi-resolution, "
+          f"{np.count_nonzero(~np.isnan(rows[:, 2]))}/{len(rows)} fixed {CHUNK}")
+
+if __name__ == "__main__":
+    main()
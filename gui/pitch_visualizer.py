@@ -1,33 +1,52 @@
 import pygame
 import sys
 import threading
+import collections
 import numpy as np
-from models.real_time_pitch_detector import detect_pitch, create_audio_stream, fs, CHUNK
+import soundfile as sf
+from models.real_time_pitch_detector import detect_pitch_multi_resolution, create_audio_stream, InputXruns, fs, CHUNK
+from models.multi_resolution_detector import MultiResolutionPitchDetector
 from models.pitch_shifter import PitchShifter
+from models.voice_activity import VoiceActivityDetector
+from gui.spectrogram_view import SpectrogramView
+from gui.waveform_view import WaveformView
+from models.analysis_cache import AnalysisCache
+from models.effect_graph import EffectGraph, PRESETS
+from utils.audio_player import PlaybackEngine
+from utils.audio_io import AudioSink, file_blocks
+from utils.peak_pyramid import PeakPyramid
+from utils.pitch_data import estimate_key, diatonic_shift_curve
 import pyaudio
-import wave
 from datetime import datetime
 import os
+import time
 import subprocess
-from pydub import AudioSegment
-import simpleaudio as sa
 
 pygame.init()
 
 WINDOW_WIDTH = 800
-WINDOW_HEIGHT = 650
+WINDOW_HEIGHT = 790
 FPS = 60
+STATUS_REFRESH_MS = 250
+ANALYSIS_EVENT = pygame.USEREVENT + 1
+STATE_EVENT = pygame.USEREVENT + 2
+WAVEFORM_EVENT = pygame.USEREVENT + 3
+WAVEFORM_REFRESH_S = 0.1
 CHART_HEIGHT = 200
 CHART_WIDTH = 700
 CHART_X = (WINDOW_WIDTH - CHART_WIDTH) // 2
 CHART_Y = 220
 NUM_BARS = 500
+HISTORY_Y = 465
+HISTORY_HEIGHT = 120
+HISTORY_FRAMES = 2048
 
 RECORD_FORMAT = pyaudio.paInt16
 RECORD_CHANNELS = 1
 RECORD_RATE = 44100
 RECORD_CHUNK = 1024
 RECORD_DURATION = 60
+RECORDING_FILE = "recording.flac"
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -51,15 +70,16 @@ def create_gradient(color1, color2, height):
     return gradient
 
 class PitchVisualizer:
-    def __init__(self):
+    def __init__(self, stream_factory=create_audio_stream, player_backend=None):
         self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         pygame.display.set_caption("Real-time Pitch Detector")
         self.clock = pygame.time.Clock()
+        self.stream_factory = stream_factory
         
         self.background_gradient = create_gradient(BACKGROUND_TOP, BACKGROUND_BOTTOM, WINDOW_HEIGHT)
         self.bar_gradient = create_gradient(BLUE, PURPLE, CHART_HEIGHT)
         
-        self.pitch_shifter = PitchShifter()
+        self.pitch_shifter = PitchShifter(cache=AnalysisCache())
         
         self.button_width = 180
         self.button_height = 45
@@ -115,18 +135,25 @@ class PitchVisualizer:
         
         self.is_recording = False
         self.is_recording_wav = False
-        self.is_playing_shifted = False
-        self.is_playing_chorus = False
-        self.is_playing_harmonizer = False
-        self.current_play_obj = None
-        self.chorus_play_obj = None
-        self.harmonizer_play_obj = None
+        self.player = PlaybackEngine(backend=player_backend)
+        self.player.start()
+        self.shifted_voice = None
+        self.chorus_voice = None
+        self.harmonizer_voice = None
+        self.time_to_first_sound = None
         self.stream = None
         self.update_thread = None
         self.current_note = "--"
         self.current_freq = "--"
         
         self.stream_lock = threading.Lock()
+        self.vad = VoiceActivityDetector()
+        self.pitch_detector = MultiResolutionPitchDetector(hop=CHUNK // 2, rate=fs)
+        self.input_xruns = InputXruns()
+        # Optional measurement hook (see benchmarks/measure_latency.py): told
+        # when each hop is analysed and when a note reaches the screen.
+        self.latency_probe = None
+        self.displayed_note = None
         
         self.spectrum_data = None
         self.max_freq = 4200
@@ -134,6 +161,41 @@ class PitchVisualizer:
         
         self.freq_label_step = 600
         
+        self.history_view = SpectrogramView(CHART_X, HISTORY_Y, CHART_WIDTH, HISTORY_HEIGHT,
+                                            self.max_freq, history=HISTORY_FRAMES)
+        self.pending_frames = collections.deque()
+        # The waveform shares the history panel's slot, so the window keeps
+        # its height; W switches between the two.
+        self.waveform_view = WaveformView(CHART_X, HISTORY_Y, CHART_WIDTH, HISTORY_HEIGHT, self.label_font)
+        self.show_waveform = False
+        self.last_waveform_post = 0.0
+        
+        self.background = self.create_background()
+        self.regions = {
+            "note": pygame.Rect(WINDOW_WIDTH // 2 - 170, 95, 340, 115),
+            "chart": pygame.Rect(CHART_X - 30, CHART_Y - 4, CHART_WIDTH + 60, CHART_HEIGHT + 40),
+            "history": self.history_view.rect.inflate(4, 4),
+            "slider": pygame.Rect(self.slider_x - 15, self.slider_y - 45, self.slider_width + 30, 60),
+            "status": pygame.Rect(0, WINDOW_HEIGHT - 40, WINDOW_WIDTH, 30),
+        }
+        for name, (_, x, y, width, height, *_rest) in self.button_specs().items():
+            self.regions[name] = pygame.Rect(x, y, width + 2, height + 2)
+        self.dirty = set(self.regions)
+        self.hovered_button = None
+        self.last_state = None
+    
+    @property
+    def is_playing_shifted(self):
+        return self.player.is_playing(self.shifted_voice)
+    
+    @property
+    def is_playing_chorus(self):
+        return self.player.is_playing(self.chorus_voice)
+    
+    @property
+    def is_playing_harmonizer(self):
+        return self.player.is_playing(self.harmonizer_voice)
+        
     def draw_text(self, text, font, color, x, y, background=None):
         text_surface = font.render(text, True, color, background)
         text_rect = text_surface.get_rect(center=(x, y))
@@ -239,9 +301,156 @@ class PitchVisualizer:
             x = CHART_X + (CHART_WIDTH * i * self.freq_label_step) // self.max_freq
             self.draw_text(str(freq), self.label_font, DARK_GRAY, x, CHART_Y + CHART_HEIGHT + 20)
     
-    def draw_background(self):
+    def draw_history(self):
+        while self.pending_frames:
+            spectrum, freq = self.pending_frames.popleft()
+            self.history_view.push(spectrum, freq)
+        if self.show_waveform:
+            self.draw_waveform()
+        else:
+            self.history_view.draw(self.screen)
+    
+    def draw_waveform(self):
+        self.waveform_view.cursor = None
+        pyramid = self.waveform_view.pyramid
+        for voice_id in (self.shifted_voice, self.chorus_voice, self.harmonizer_voice):
+            position = self.player.position(voice_id)
+            if position is not None and pyramid is not None:
+                self.waveform_view.cursor = int(position[0] * pyramid.rate)
+        self.waveform_view.draw(self.screen)
+    
+    def post_waveform(self, force=False):
+        # Called from worker threads for every block; the view is redrawn at
+        # most every WAVEFORM_REFRESH_S.
+        now = time.perf_counter()
+        if force or now - self.last_waveform_post >= WAVEFORM_REFRESH_S:
+            self.last_waveform_post = now
+            pygame.event.post(pygame.event.Event(WAVEFORM_EVENT))
+    
+    def load_waveform(self):
+        if not os.path.exists(RECORDING_FILE):
+            return
+        try:
+            self.waveform_view.set_pyramid(PeakPyramid.for_file(RECORDING_FILE))
+            self.post_waveform(force=True)
+        except Exception as e:
+            print(f"Error loading waveform: {e}")
+    
+    def create_background(self):
+        background = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
         for y in range(WINDOW_HEIGHT):
-            pygame.draw.line(self.screen, self.background_gradient[y], (0, y), (WINDOW_WIDTH, y))
+            pygame.draw.line(background, self.background_gradient[y], (0, y), (WINDOW_WIDTH, y))
+        
+        screen, self.screen = self.screen, background
+        for offset in range(1, 4):
+            alpha = 100 - offset * 25
+            self.draw_text("Real-time Pitch Detector", self.title_font, (*DARK_GRAY, alpha), 
+                         WINDOW_WIDTH // 2 + offset, 52 + offset)
+        self.draw_text("Real-time Pitch Detector", self.title_font, BLUE, WINDOW_WIDTH // 2, 50)
+        self.screen = screen
+        return background
+    
+    def draw_note(self):
+        note_bg = pygame.Surface((320, 100), pygame.SRCALPHA)
+        pygame.draw.rect(note_bg, (*WHITE, 230), note_bg.get_rect(), border_radius=15)
+        self.screen.blit(note_bg, (WINDOW_WIDTH // 2 - 160, 100))
+        self.displayed_note = self.current_note
+        self.draw_text(f"Note: {self.current_note}", self.note_font, BLUE, WINDOW_WIDTH // 2, 150)
+        
+        self.draw_text(f"Frequency: {self.current_freq} Hz", self.freq_font, (*DARK_GRAY, 100), 
+                     WINDOW_WIDTH // 2 + 1, 191)
+        self.draw_text(f"Frequency: {self.current_freq} Hz", self.freq_font, DARK_GRAY, 
+                     WINDOW_WIDTH // 2, 190)
+    
+    def button_specs(self):
+        return {
+            "pitch_button": ("Stop Recording" if self.is_recording else "Start Recording",
+                             self.button_x, self.button_y, self.button_width, self.button_height,
+                             self.button_color, self.button_hover_color),
+            "wav_button": ("Recording..." if self.is_recording_wav else "Record Audio",
+                           self.wav_button_x, self.wav_button_y, self.wav_button_width, self.wav_button_height,
+                           self.wav_button_color, self.wav_button_hover_color),
+            "shift_button": ("Stop Playing" if self.is_playing_shifted else "Play Audio",
+                             self.shift_button_x, self.shift_button_y,
+                             self.shift_button_width, self.shift_button_height,
+                             self.shift_button_color, self.shift_button_hover_color),
+            "chorus_button": ("Stop Chorus" if self.is_playing_chorus else "Chorus Effect",
+                              self.chorus_button_x, self.chorus_button_y,
+                              self.chorus_button_width, self.chorus_button_height,
+                              self.chorus_button_color, self.chorus_button_hover_color,
+                              self.harmonizer_font),
+            "harmonizer_button": ("Stop Harmonizer" if self.is_playing_harmonizer else "Harmonic Effect",
+                                  self.harmonizer_button_x, self.harmonizer_button_y,
+                                  self.harmonizer_button_width, self.harmonizer_button_height,
+                                  self.harmonizer_button_color, self.harmonizer_button_hover_color,
+                                  self.harmonizer_font),
+        }
+    
+    def draw_region(self, name):
+        if name == "note":
+            self.draw_note()
+        elif name == "chart":
+            self.draw_chart()
+        elif name == "history":
+            self.draw_history()
+        elif name == "slider":
+            self.draw_slider()
+        elif name == "status":
+            self.draw_playback_status()
+        else:
+            self.draw_button(*self.button_specs()[name])
+    
+    def mark_dirty(self, *names):
+        self.dirty.update(names)
+    
+    def mark_panel(self, waveform):
+        # The history slot is only redrawn for the view it is showing.
+        if waveform == self.show_waveform:
+            self.mark_dirty("history")
+    
+    def redraw(self, full=False):
+        if full:
+            self.screen.blit(self.background, (0, 0))
+            self.dirty = set(self.regions)
+        rects = []
+        note_drawn = "note" in self.dirty
+        for name in self.dirty:
+            rect = self.regions[name]
+            self.screen.set_clip(rect)
+            self.screen.blit(self.background, rect, rect)
+            self.draw_region(name)
+            rects.append(rect)
+        self.screen.set_clip(None)
+        self.dirty.clear()
+        if full:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        if note_drawn and self.latency_probe is not None:
+            self.latency_probe.displayed(self.displayed_note, time.perf_counter())
+    
+    def notify_state(self):
+        pygame.event.post(pygame.event.Event(STATE_EVENT))
+    
+    def start_task(self, target):
+        def task():
+            try:
+                target()
+            finally:
+                self.notify_state()
+        threading.Thread(target=task).start()
+    
+    def is_busy(self):
+        return self.is_recording_wav or self.is_playing_shifted or self.is_playing_chorus or self.is_playing_harmonizer
+    
+    def check_state(self):
+        state = (self.is_recording, self.is_recording_wav, self.is_playing_shifted,
+                 self.is_playing_chorus, self.is_playing_harmonizer)
+        if state != self.last_state:
+            self.mark_dirty("status", *self.button_specs())
+            if self.last_state is None or state[0] != self.last_state[0]:
+                self.mark_dirty("note", "chart", "history")
+            self.last_state = state
     
     def toggle_recording(self):
         if not self.is_recording:
@@ -251,7 +460,10 @@ class PitchVisualizer:
     
     def start_recording(self):
         self.is_recording = True
-        self.stream = create_audio_stream()
+        self.vad.reset()
+        self.pitch_detector.reset()
+        self.input_xruns.reset()
+        self.stream = self.stream_factory()
         self.update_thread = threading.Thread(target=self.update_display)
         self.update_thread.daemon = True
         self.update_thread.start()
@@ -282,12 +494,20 @@ class PitchVisualizer:
                 if not self.stream:
                     break
                 try:
-                    note, freq, spectrum = detect_pitch(self.stream)
-                    if note and freq and spectrum:
+                    note, freq, spectrum = detect_pitch_multi_resolution(self.stream, self.pitch_detector, self.vad,
+                                                                         self.input_xruns)
+                    analysed = bool(note and freq and spectrum)
+                    if self.latency_probe is not None:
+                        self.latency_probe.analysed(note if analysed else None, time.perf_counter())
+                    if analysed:
                         self.current_note = note
                         self.current_freq = f"{freq:.1f}"
                         self.detected_freq = freq
                         self.spectrum_data = spectrum
+                        self.pending_frames.append((spectrum, freq))
+                    else:
+                        self.pending_frames.append((None, None))
+                    pygame.event.post(pygame.event.Event(ANALYSIS_EVENT, analysed=analysed))
                 except Exception as e:
                     print(f"Error in update_display: {e}")
                     break
@@ -297,35 +517,39 @@ class PitchVisualizer:
             return
             
         self.is_recording_wav = True
-        output_file = "recording.wav"
+        output_file = RECORDING_FILE
         
         audio = pyaudio.PyAudio()
         stream = audio.open(format=RECORD_FORMAT, channels=RECORD_CHANNELS, rate=RECORD_RATE,
                           input=True, frames_per_buffer=RECORD_CHUNK)
         
         print(f"Recording to {output_file}...")
-        frames = []
+        sink = AudioSink(output_file, RECORD_RATE, RECORD_CHANNELS)
+        pyramid = PeakPyramid(RECORD_RATE)
+        self.waveform_view.set_pyramid(pyramid)
+        self.waveform_view.set_overlay(None)
         
         total_chunks = int(RECORD_RATE / RECORD_CHUNK * RECORD_DURATION)
         
-        for _ in range(total_chunks):
-            if not self.is_recording_wav:
-                break
-            data = stream.read(RECORD_CHUNK)
-            frames.append(data)
-        
-        print("Recording complete.")
-        
-        stream.stop_stream()
-        stream.close()
-        audio.terminate()
-        
-        with wave.open(output_file, 'wb') as wf:
-            wf.setnchannels(RECORD_CHANNELS)
-            wf.setsampwidth(audio.get_sample_size(RECORD_FORMAT))
-            wf.setframerate(RECORD_RATE)
-            wf.writeframes(b''.join(frames))
-        
+        try:
+            for _ in range(total_chunks):
+                if not self.is_recording_wav:
+                    break
+                data = stream.read(RECORD_CHUNK)
+                sink.write(data)
+                pyramid.append(np.frombuffer(data, dtype=np.int16).reshape(-1, RECORD_CHANNELS).T / 32768)
+                self.post_waveform()
+        finally:
+            print("Recording complete.")
+            
+            stream.stop_stream()
+            stream.close()
+            audio.terminate()
+            sink.close()
+            self.post_waveform(force=True)
+        
+        if os.path.exists(output_file):
+            pyramid.save(output_file)
         print(f"Audio saved to {output_file}")
         self.is_recording_wav = False
 
@@ -377,6 +601,26 @@ class PitchVisualizer:
         self.draw_text(value_text, self.button_font, DARK_GRAY,
                       WINDOW_WIDTH // 2, label_y)
 
+    def draw_playback_status(self):
+        labels = []
+        for name, voice_id in (("Audio", self.shifted_voice), ("Chorus", self.chorus_voice),
+                               ("Harmonizer", self.harmonizer_voice)):
+            position = self.player.position(voice_id)
+            if position is not None:
+                elapsed, total = position
+                labels.append(f"{name} {int(elapsed) // 60}:{int(elapsed) % 60:02d} / {int(total) // 60}:{int(total) % 60:02d}")
+        if labels and self.time_to_first_sound is not None and self.is_playing_shifted:
+            labels.append(f"first sound {self.time_to_first_sound * 1000:.0f} ms")
+        if self.is_recording:
+            labels.append(f"{self.vad.analysed_frames} frames analysed, {self.vad.skipped_frames} skipped as silence")
+            if self.input_xruns.overflows:
+                labels.append(f"{self.input_xruns.overflows} input overflows")
+        underruns = self.player.underruns()
+        if labels and (underruns["stream"] or underruns["device"]):
+            labels.append(f"{underruns['stream'] + underruns['device']} playback underruns")
+        if labels:
+            self.draw_text("   ".join(labels), self.label_font, DARK_GRAY, WINDOW_WIDTH // 2, WINDOW_HEIGHT - 25)
+
     def handle_slider_interaction(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
             value_range = 24
@@ -399,411 +643,181 @@ class PitchVisualizer:
             self.slider_value = max(-12, min(12, self.slider_value))
 
     def shift_and_play_audio(self):
-        if not os.path.exists("recording.wav"):
+        requested_at = time.perf_counter()
+        if not os.path.exists(RECORDING_FILE):
             print("No recording found. Please record audio first.")
             return
             
         try:
             if self.is_playing_shifted:
-                if self.current_play_obj:
-                    self.current_play_obj.stop()
-                self.current_play_obj = None
-                self.is_playing_shifted = False
+                self.player.stop(self.shifted_voice)
+                self.shifted_voice = None
                 return
             
-            self.pitch_shifter.shift_pitch("recording.wav", "shifted_temp.wav", self.slider_value)
+            voice_id = self.player.open_stream(requested_at=requested_at)
+            self.shifted_voice = voice_id
+            self.notify_state()
+            self.play_blocks(voice_id, self.pitch_shifter.render_segments(RECORDING_FILE, self.slider_value))
             
-            try:
-                audio = AudioSegment.from_wav("shifted_temp.wav")
-                audio = audio.set_frame_rate(RECORD_RATE)
-                audio.export("shifted.wav", format="wav")
-                
-                if os.path.exists("shifted_temp.wav"):
-                    try:
-                        os.remove("shifted_temp.wav")
-                    except:
-                        pass
-                
-                wave_obj = sa.WaveObject.from_wave_file("shifted.wav")
-                self.current_play_obj = wave_obj.play()
-                self.is_playing_shifted = True
-                
-                def monitor_playback():
-                    try:
-                        if self.current_play_obj:
-                            self.current_play_obj.wait_done()
-                    except Exception as e:
-                        print(f"Error in playback monitoring: {e}")
-                    finally:
-                        self.is_playing_shifted = False
-                        self.current_play_obj = None
-                        if os.path.exists("shifted_temp.wav"):
-                            try:
-                                os.remove("shifted_temp.wav")
-                            except:
-                                pass
-                
-                threading.Thread(target=monitor_playback, daemon=True).start()
-                
-            except Exception as e:
-                print(f"Error playing shifted audio: {e}")
-                import traceback
-                traceback.print_exc()
-                self.is_playing_shifted = False
-                self.current_play_obj = None
-                if os.path.exists("shifted_temp.wav"):
-                    try:
-                        os.remove("shifted_temp.wav")
-                    except:
-                        pass
+            stats = self.player.stream_stats(voice_id)
+            if stats and stats["time_to_first_sound"] is not None:
+                self.time_to_first_sound = stats["time_to_first_sound"]
+                print(f"Time to first sound: {self.time_to_first_sound * 1000:.0f} ms")
                 
         except Exception as e:
             print(f"Error in shift_and_play_audio: {e}")
             import traceback
             traceback.print_exc()
-            self.is_playing_shifted = False
-            self.current_play_obj = None
+            self.shifted_voice = None
+
+    def open_effect(self, preset, requested_at, **params):
+        rate = sf.info(RECORDING_FILE).samplerate
+        graph = EffectGraph.from_preset(PRESETS[preset], self.pitch_shifter, rate, **params)
+        # The recording's analysis comes from the cache, as for plain playback.
+        graph.use_analysis(self.pitch_shifter.analyze_stft(RECORDING_FILE))
+        voice_id = self.player.open_stream(requested_at=requested_at)
+        self.notify_state()
+        return voice_id, graph
+
+    def play_blocks(self, voice_id, blocks):
+        # What is played is also drawn over the recording's waveform.
+        overlay = PeakPyramid(sf.info(RECORDING_FILE).samplerate)
+        self.waveform_view.set_overlay(overlay)
+        try:
+            for block in blocks:
+                overlay.append(block)
+                self.post_waveform()
+                if not self.player.feed(voice_id, block.T):
+                    break
+        finally:
+            self.player.finish(voice_id)
+            self.post_waveform(force=True)
+
+    def play_graph(self, voice_id, graph):
+        self.play_blocks(voice_id, graph.stream(file_blocks(RECORDING_FILE)))
 
     def create_harmonizer_effect(self):
-        if not os.path.exists("recording.wav"):
+        requested_at = time.perf_counter()
+        if not os.path.exists(RECORDING_FILE):
             print("No recording found. Please record audio first.")
             return
             
         try:
             if self.is_playing_harmonizer:
-                if self.harmonizer_play_obj:
-                    self.harmonizer_play_obj.stop()
-                self.harmonizer_play_obj = None
-                self.is_playing_harmonizer = False
+                self.player.stop(self.harmonizer_voice)
+                self.harmonizer_voice = None
                 return
 
-            self.pitch_shifter.shift_pitch("recording.wav", "shifted_temp.wav", self.slider_value)
-            try:
-                audio = AudioSegment.from_wav("shifted_temp.wav")
-                audio = audio.set_frame_rate(RECORD_RATE)
-                audio.export("shifted.wav", format="wav")
-                
-                if os.path.exists("shifted_temp.wav"):
-                    try:
-                        os.remove("shifted_temp.wav")
-                    except:
-                        pass
-            except Exception as e:
-                print(f"Error generating shifted audio: {e}")
-                return
-
-            self.pitch_shifter.shift_pitch("shifted.wav", "lower_harmony.wav", -3.02)
-            self.pitch_shifter.shift_pitch("shifted.wav", "upper_harmony.wav", 3.98)
-            self.pitch_shifter.shift_pitch("shifted.wav", "fifth_harmony.wav", 7.02)
-            self.pitch_shifter.shift_pitch("shifted.wav", "octave.wav", 11.98)
-            self.pitch_shifter.shift_pitch("shifted.wav", "lower_detune.wav", -3.08)
-            self.pitch_shifter.shift_pitch("shifted.wav", "upper_detune.wav", 4.04)
-
-            try:
-                original = AudioSegment.from_wav("shifted.wav").set_frame_rate(RECORD_RATE)
-                lower = AudioSegment.from_wav("lower_harmony.wav").set_frame_rate(RECORD_RATE)
-                upper = AudioSegment.from_wav("upper_harmony.wav").set_frame_rate(RECORD_RATE)
-                fifth = AudioSegment.from_wav("fifth_harmony.wav").set_frame_rate(RECORD_RATE)
-                octave = AudioSegment.from_wav("octave.wav").set_frame_rate(RECORD_RATE)
-                lower_detune = AudioSegment.from_wav("lower_detune.wav").set_frame_rate(RECORD_RATE)
-                upper_detune = AudioSegment.from_wav("upper_detune.wav").set_frame_rate(RECORD_RATE)
-
-                silence_10ms = AudioSegment.silent(duration=10)
-                silence_15ms = AudioSegment.silent(duration=15)
-                silence_20ms = AudioSegment.silent(duration=20)
-                silence_25ms = AudioSegment.silent(duration=25)
-                silence_30ms = AudioSegment.silent(duration=30)
-
-                lower = silence_10ms + lower
-                upper = silence_15ms + upper
-                fifth = silence_20ms + fifth
-                octave = silence_25ms + octave
-                lower_detune = silence_20ms + lower_detune
-                upper_detune = silence_30ms + upper_detune
-
-                lower = lower.pan(-0.3)
-                upper = upper.pan(0.3)
-                fifth = fifth.pan(-0.15)
-                octave = octave.pan(0.15)
-                lower_detune = lower_detune.pan(-0.4)
-                upper_detune = upper_detune.pan(0.4)
-
-                original = original - 2
-                lower = lower - 6
-                upper = upper - 5
-                fifth = fifth - 7
-                octave = octave - 8
-                lower_detune = lower_detune - 9
-                upper_detune = upper_detune - 9
-
-                lower = lower.overlay(lower_detune)
-                upper = upper.overlay(upper_detune)
-
-                combined_audio = original
-                combined_audio = combined_audio.overlay(lower)
-                combined_audio = combined_audio.overlay(upper)
-                combined_audio = combined_audio.overlay(fifth)
-                combined_audio = combined_audio.overlay(octave)
-
-                reverb_copies = []
-                for i in range(3):
-                    delay_ms = 40 + (i * 20)
-                    volume_reduction = 15 + (i * 3)
-                    reverb_copy = combined_audio - volume_reduction
-                    reverb_copy = AudioSegment.silent(duration=delay_ms) + reverb_copy
-                    reverb_copies.append(reverb_copy)
-
-                for reverb in reverb_copies:
-                    combined_audio = combined_audio.overlay(reverb)
-
-                combined_audio = combined_audio + 4
-
-                combined_audio.export("harmonized.wav", format="wav", 
-                                    parameters=["-ar", str(RECORD_RATE), "-q:a", "0"])
-
-                wave_obj = sa.WaveObject.from_wave_file("harmonized.wav")
-                self.harmonizer_play_obj = wave_obj.play()
-                self.is_playing_harmonizer = True
-                
-                def monitor_playback():
-                    if self.harmonizer_play_obj:
-                        self.harmonizer_play_obj.wait_done()
-                        self.is_playing_harmonizer = False
-                        self.harmonizer_play_obj = None
-                
-                threading.Thread(target=monitor_playback, daemon=True).start()
-                
-            except Exception as e:
-                print(f"Error mixing audio: {e}")
-                import traceback
-                traceback.print_exc()
-                self.is_playing_harmonizer = False
-                self.harmonizer_play_obj = None
-            finally:
-                temp_files = ["lower_harmony.wav", "upper_harmony.wav", "fifth_harmony.wav", 
-                            "octave.wav", "lower_detune.wav", "upper_detune.wav"]
-                for file in temp_files:
-                    if os.path.exists(file):
-                        try:
-                            os.remove(file)
-                        except:
-                            pass
+            # The shifted voice keeps the recording's frame grid, so its pitch
+            # track is the recording's scaled by the slider shift.
+            freqs = self.pitch_shifter.frame_frequencies(RECORDING_FILE) * 2 ** (self.slider_value / 12)
+            tonic, scale = estimate_key(freqs)
+            self.harmonizer_voice, graph = self.open_effect(
+                "harmonizer", requested_at, shift=self.slider_value,
+                third_below=diatonic_shift_curve(freqs, tonic, -2, scale),
+                third_above=diatonic_shift_curve(freqs, tonic, 2, scale),
+                fifth_above=diatonic_shift_curve(freqs, tonic, 4, scale))
+            self.play_graph(self.harmonizer_voice, graph)
                 
         except Exception as e:
             print(f"Error creating harmonizer effect: {e}")
-            self.is_playing_harmonizer = False
-            self.harmonizer_play_obj = None
+            import traceback
+            traceback.print_exc()
+            self.harmonizer_voice = None
 
     def create_chorus_effect(self):
-        if not os.path.exists("recording.wav"):
+        requested_at = time.perf_counter()
+        if not os.path.exists(RECORDING_FILE):
             print("No recording found. Please record audio first.")
             return
             
         try:
             if self.is_playing_chorus:
-                if self.chorus_play_obj:
-                    self.chorus_play_obj.stop()
-                self.chorus_play_obj = None
-                self.is_playing_chorus = False
+                self.player.stop(self.chorus_voice)
+                self.chorus_voice = None
                 return
 
-            self.pitch_shifter.shift_pitch("recording.wav", "shifted_temp.wav", self.slider_value)
-            try:
-                audio = AudioSegment.from_wav("shifted_temp.wav")
-                audio = audio.set_frame_rate(RECORD_RATE)
-                audio.export("shifted.wav", format="wav")
-                
-                if os.path.exists("shifted_temp.wav"):
-                    try:
-                        os.remove("shifted_temp.wav")
-                    except:
-                        pass
-            except Exception as e:
-                print(f"Error generating shifted audio: {e}")
-                return
-
-            self.pitch_shifter.shift_pitch("shifted.wav", "chorus1.wav", 0.12)
-            self.pitch_shifter.shift_pitch("shifted.wav", "chorus2.wav", -0.15)
-            self.pitch_shifter.shift_pitch("shifted.wav", "chorus3.wav", 0.08)
-            self.pitch_shifter.shift_pitch("shifted.wav", "chorus4.wav", -0.10)
-            self.pitch_shifter.shift_pitch("shifted.wav", "chorus5.wav", 0.18)
-            self.pitch_shifter.shift_pitch("shifted.wav", "chorus6.wav", -0.08)
-            
-            try:
-                original = AudioSegment.from_wav("shifted.wav").set_frame_rate(RECORD_RATE)
-                chorus1 = AudioSegment.from_wav("chorus1.wav").set_frame_rate(RECORD_RATE)
-                chorus2 = AudioSegment.from_wav("chorus2.wav").set_frame_rate(RECORD_RATE)
-                chorus3 = AudioSegment.from_wav("chorus3.wav").set_frame_rate(RECORD_RATE)
-                chorus4 = AudioSegment.from_wav("chorus4.wav").set_frame_rate(RECORD_RATE)
-                chorus5 = AudioSegment.from_wav("chorus5.wav").set_frame_rate(RECORD_RATE)
-                chorus6 = AudioSegment.from_wav("chorus6.wav").set_frame_rate(RECORD_RATE)
-                
-                delay1 = 25
-                delay2 = 35
-                delay3 = 18
-                delay4 = 28
-                delay5 = 15
-                delay6 = 22
-                
-                silence1 = AudioSegment.silent(duration=delay1)
-                silence2 = AudioSegment.silent(duration=delay2)
-                silence3 = AudioSegment.silent(duration=delay3)
-                silence4 = AudioSegment.silent(duration=delay4)
-                silence5 = AudioSegment.silent(duration=delay5)
-                silence6 = AudioSegment.silent(duration=delay6)
-                
-                chorus1 = silence1 + chorus1
-                chorus2 = silence2 + chorus2
-                chorus3 = silence3 + chorus3
-                chorus4 = silence4 + chorus4
-                chorus5 = silence5 + chorus5
-                chorus6 = silence6 + chorus6
-                
-                original = original - 2
-                chorus1 = chorus1 - 5
-                chorus2 = chorus2 - 6
-                chorus3 = chorus3 - 4
-                chorus4 = chorus4 - 5
-                chorus5 = chorus5 - 7
-                chorus6 = chorus6 - 6
-                
-                chorus1 = chorus1.pan(-0.2)
-                chorus2 = chorus2.pan(0.25)
-                chorus3 = chorus3.pan(-0.15)
-                chorus4 = chorus4.pan(0.2)
-                chorus5 = chorus5.pan(-0.3)
-                chorus6 = chorus6.pan(0.3)
-                
-                combined_audio = original.overlay(chorus1)
-                combined_audio = combined_audio.overlay(chorus2)
-                combined_audio = combined_audio.overlay(chorus3)
-                combined_audio = combined_audio.overlay(chorus4)
-                combined_audio = combined_audio.overlay(chorus5)
-                combined_audio = combined_audio.overlay(chorus6)
-                
-                combined_audio = combined_audio + 2
-                
-                combined_audio.export("chorus.wav", format="wav", parameters=["-ar", str(RECORD_RATE)])
-                
-                wave_obj = sa.WaveObject.from_wave_file("chorus.wav")
-                self.chorus_play_obj = wave_obj.play()
-                self.is_playing_chorus = True
-                
-                def monitor_playback():
-                    if self.chorus_play_obj:
-                        self.chorus_play_obj.wait_done()
-                        self.is_playing_chorus = False
-                        self.chorus_play_obj = None
-                
-                threading.Thread(target=monitor_playback, daemon=True).start()
-                
-            except Exception as e:
-                print(f"Error creating chorus effect: {e}")
-                import traceback
-                traceback.print_exc()
-                self.is_playing_chorus = False
-                self.chorus_play_obj = None
-            finally:
-                temp_files = ["chorus1.wav", "chorus2.wav", "chorus3.wav", "chorus4.wav", "chorus5.wav", "chorus6.wav"]
-                for file in temp_files:
-                    if os.path.exists(file):
-                        try:
-                            os.remove(file)
-                        except:
-                            pass
+            self.chorus_voice, graph = self.open_effect("chorus", requested_at, shift=self.slider_value)
+            self.play_graph(self.chorus_voice, graph)
                 
         except Exception as e:
             print(f"Error creating chorus effect: {e}")
-            self.is_playing_chorus = False
-            self.chorus_play_obj = None
+            import traceback
+            traceback.print_exc()
+            self.chorus_voice = None
 
+    def handle_click(self, pos):
+        for name, (_, x, y, width, height, *_rest) in self.button_specs().items():
+            if not pygame.Rect(x, y, width, height).collidepoint(pos):
+                continue
+            if name == "pitch_button":
+                self.toggle_recording()
+            elif name == "wav_button":
+                if self.is_recording_wav:
+                    self.is_recording_wav = False
+                else:
+                    self.start_task(self.record_to_wav)
+            elif name == "shift_button":
+                self.start_task(self.shift_and_play_audio)
+            elif name == "chorus_button":
+                self.start_task(self.create_chorus_effect)
+            elif name == "harmonizer_button":
+                self.start_task(self.create_harmonizer_effect)
+    
+    def handle_event(self, event):
+        if event.type == ANALYSIS_EVENT:
+            if event.analysed:
+                self.mark_dirty("note", "chart")
+            self.mark_dirty("status")
+            self.mark_panel(waveform=False)
+        elif event.type == WAVEFORM_EVENT:
+            self.mark_panel(waveform=True)
+        elif event.type == pygame.NOEVENT:
+            self.mark_dirty("status")
+            self.mark_panel(waveform=True)
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_w:
+            self.show_waveform = not self.show_waveform
+            self.mark_dirty("history")
+        elif event.type == pygame.MOUSEMOTION:
+            hovered = next((name for name, rect in self.regions.items()
+                            if name.endswith("_button") and rect.collidepoint(event.pos)), None)
+            if hovered != self.hovered_button:
+                self.mark_dirty(*(name for name in (hovered, self.hovered_button) if name))
+                self.hovered_button = hovered
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            self.handle_click(event.pos)
+        
+        if self.show_waveform and self.waveform_view.handle_event(event):
+            self.mark_dirty("history")
+        if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) or (
+                event.type == pygame.MOUSEMOTION and self.is_dragging):
+            self.handle_slider_interaction(event)
+            self.mark_dirty("slider")
+    
     def run(self):
+        # Redraws are event driven: the loop sleeps in event.wait until input,
+        # an analysis frame or a state change arrives, then re-blits only the
+        # regions marked dirty. While something is playing it also wakes every
+        # STATUS_REFRESH_MS to advance the position readout.
+        self.start_task(self.load_waveform)
+        self.redraw(full=True)
         running = True
         while running:
-            for event in pygame.event.get():
+            events = [pygame.event.wait(STATUS_REFRESH_MS if self.is_busy() else 0)]
+            events.extend(pygame.event.get())
+            for event in events:
                 if event.type == pygame.QUIT:
                     running = False
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    pitch_button_rect = pygame.Rect(self.button_x, self.button_y, self.button_width, self.button_height)
-                    if pitch_button_rect.collidepoint(event.pos):
-                        self.toggle_recording()
-                    
-                    wav_button_rect = pygame.Rect(self.wav_button_x, self.wav_button_y, self.wav_button_width, self.wav_button_height)
-                    if wav_button_rect.collidepoint(event.pos):
-                        if self.is_recording_wav:
-                            self.is_recording_wav = False
-                        else:
-                            threading.Thread(target=self.record_to_wav).start()
-                    
-                    shift_button_rect = pygame.Rect(self.shift_button_x, self.shift_button_y, 
-                                                  self.shift_button_width, self.shift_button_height)
-                    if shift_button_rect.collidepoint(event.pos):
-                        threading.Thread(target=self.shift_and_play_audio).start()
-                    
-                    chorus_button_rect = pygame.Rect(self.chorus_button_x, self.chorus_button_y,
-                                                   self.chorus_button_width, self.chorus_button_height)
-                    if chorus_button_rect.collidepoint(event.pos):
-                        threading.Thread(target=self.create_chorus_effect).start()
-                    
-                    harmonizer_button_rect = pygame.Rect(self.harmonizer_button_x, self.harmonizer_button_y,
-                                                       self.harmonizer_button_width, self.harmonizer_button_height)
-                    if harmonizer_button_rect.collidepoint(event.pos):
-                        threading.Thread(target=self.create_harmonizer_effect).start()
-                
-                self.handle_slider_interaction(event)
+                else:
+                    self.handle_event(event)
             
-            self.draw_background()
-            
-            shadow_offset = 2
-            for offset in range(1, 4):
-                alpha = 100 - offset * 25
-                self.draw_text("Real-time Pitch Detector", self.title_font, (*DARK_GRAY, alpha), 
-                             WINDOW_WIDTH // 2 + offset, 52 + offset)
-            self.draw_text("Real-time Pitch Detector", self.title_font, BLUE, WINDOW_WIDTH // 2, 50)
-            
-            note_bg = pygame.Surface((320, 100), pygame.SRCALPHA)
-            pygame.draw.rect(note_bg, (*WHITE, 230), note_bg.get_rect(), border_radius=15)
-            self.screen.blit(note_bg, (WINDOW_WIDTH // 2 - 160, 100))
-            self.draw_text(f"Note: {self.current_note}", self.note_font, BLUE, WINDOW_WIDTH // 2, 150)
-            
-            self.draw_text(f"Frequency: {self.current_freq} Hz", self.freq_font, (*DARK_GRAY, 100), 
-                         WINDOW_WIDTH // 2 + 1, 191)
-            self.draw_text(f"Frequency: {self.current_freq} Hz", self.freq_font, DARK_GRAY, 
-                         WINDOW_WIDTH // 2, 190)
-            
-            self.draw_chart()
-            
-            self.draw_slider()
-            
-            pitch_button_text = "Stop Recording" if self.is_recording else "Start Recording"
-            self.draw_button(pitch_button_text, self.button_x, self.button_y, self.button_width, self.button_height,
-                           self.button_color, self.button_hover_color)
-            
-            wav_button_text = "Recording..." if self.is_recording_wav else "Record to WAV"
-            self.draw_button(wav_button_text, self.wav_button_x, self.wav_button_y, self.wav_button_width, self.wav_button_height,
-                           self.wav_button_color, self.wav_button_hover_color)
-            
-            shift_button_text = "Stop Playing" if self.is_playing_shifted else "Play Audio"
-            self.draw_button(shift_button_text, self.shift_button_x, self.shift_button_y,
-                           self.shift_button_width, self.shift_button_height,
-                           self.shift_button_color, self.shift_button_hover_color)
-            
-            chorus_button_text = "Stop Chorus" if self.is_playing_chorus else "Chorus Effect"
-            self.draw_button(chorus_button_text, self.chorus_button_x, self.chorus_button_y,
-                           self.chorus_button_width, self.chorus_button_height,
-                           self.chorus_button_color, self.chorus_button_hover_color,
-                           custom_font=self.harmonizer_font)
-            
-            harmonizer_button_text = "Stop Harmonizer" if self.is_playing_harmonizer else "Harmonic Effect"
-            self.draw_button(harmonizer_button_text, self.harmonizer_button_x, self.harmonizer_button_y,
-                           self.harmonizer_button_width, self.harmonizer_button_height,
-                           self.harmonizer_button_color, self.harmonizer_button_hover_color,
-                           custom_font=self.harmonizer_font)
-            
-            pygame.display.flip()
-            self.clock.tick(FPS)
+            self.check_state()
+            if self.dirty:
+                self.redraw()
+                self.clock.tick(FPS)
         
         self.stop_recording()
+        self.player.close()
         pygame.quit()
         sys.exit()
 
@@ -0,0 +1,82 @@
+import numpy as np
+import pygame
+
+WHITE = (255, 255, 255)
+PITCH_COLOR = (239, 68, 68)
+BORDER_COLOR = (75, 85, 99)
+
+def create_palette():
+    stops = np.array([[255, 255, 255], [96, 165, 250], [59, 130, 246], [147, 51, 234], [30, 27, 75]], dtype=float)
+    positions = np.linspace(0, 255, len(stops))
+    levels = np.arange(256)
+    return np.stack([np.interp(levels, positions, stops[:, c]) for c in range(3)], axis=1).astype(np.uint8)
+
+class SpectrogramView:
+    def __init__(self, x, y, width, height, max_freq, history=None):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.max_freq = max_freq
+        self.history_len = history if history else width
+        self.history = np.zeros((self.history_len, height), dtype=np.uint8)
+        self.pitch_history = np.full(self.history_len, np.nan)
+        self.write_index = 0
+        self.surface = pygame.Surface((self.history_len, height))
+        self.surface.fill(WHITE)
+        self.palette = create_palette()
+        self.row_map = None
+        self.row_map_key = None
+
+    def map_rows(self, freqs):
+        key = (len(freqs), freqs[1] if len(freqs) > 1 else 0)
+        if key != self.row_map_key:
+            height = self.rect.height
+            valid = freqs < self.max_freq
+            rows = (freqs[valid] / self.max_freq * height).astype(int)
+            starts = np.flatnonzero(np.diff(rows, prepend=-1))
+            self.row_map = (np.count_nonzero(valid), rows[starts], starts)
+            self.row_map_key = key
+        return self.row_map
+
+    def freq_row(self, freq):
+        return self.rect.height - 1 - int(freq / self.max_freq * self.rect.height)
+
+    def push(self, spectrum=None, pitch=None):
+        height = self.rect.height
+        column = np.zeros(height, dtype=np.uint8)
+        if spectrum is not None:
+            freqs, magnitudes = spectrum
+            count, rows, starts = self.map_rows(freqs)
+            levels = np.maximum.reduceat(magnitudes[:count], starts)
+            column[height - 1 - rows] = (np.clip(levels, 0, 1) * 255).astype(np.uint8)
+
+        index = self.write_index
+        self.history[index] = column
+        self.pitch_history[index] = pitch if pitch is not None else np.nan
+
+        colors = self.palette[column]
+        if pitch is not None and pitch < self.max_freq:
+            row = self.freq_row(pitch)
+            colors[max(row - 1, 0):row + 2] = PITCH_COLOR
+
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        pixels[index] = colors
+        del pixels
+        self.write_index = (index + 1) % self.history_len
+
+    def clear(self):
+        self.history[:] = 0
+        self.pitch_history[:] = np.nan
+        self.write_index = 0
+        self.surface.fill(WHITE)
+
+    def draw(self, screen):
+        # The surface is a ring: the newest column sits just left of
+        # write_index. Blitting the (at most two) visible spans scrolls the
+        # view without touching any other column.
+        visible = min(self.rect.width, self.history_len)
+        start = (self.write_index - visible) % self.history_len
+        x = self.rect.x + self.rect.width - visible
+        first = min(visible, self.history_len - start)
+        screen.blit(self.surface, (x, self.rect.y), pygame.Rect(start, 0, first, self.rect.height))
+        if first < visible:
+            screen.blit(self.surface, (x + first, self.rect.y), pygame.Rect(0, 0, visible - first, self.rect.height))
+        pygame.draw.rect(screen, BORDER_COLOR, self.rect, 1)
@@ -0,0 +1,113 @@
+import numpy as np
+import pygame
+
+WHITE = (255, 255, 255)
+WAVE_COLOR = (59, 130, 246)
+OVERLAY_COLOR = (147, 51, 234)
+CURSOR_COLOR = (239, 68, 68)
+BORDER_COLOR = (75, 85, 99)
+LABEL_COLOR = (75, 85, 99)
+MIN_SPAN = 256
+
+class WaveformView:
+    # Draws a recording (and optionally a rendered version of it) from peak
+    # pyramids, so a redraw costs one min/max pair per pixel column whatever
+    # the zoom. The view is the sample range [start, start + span).
+    def __init__(self, x, y, width, height, font=None):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.font = font
+        self.pyramid = None
+        self.overlay = None
+        self.start = 0
+        self.span = 0
+        self.cursor = None
+        self.drag_x = None
+
+    def total(self):
+        lengths = [p.total for p in (self.pyramid, self.overlay) if p is not None]
+        return max(lengths) if lengths else 0
+
+    def set_pyramid(self, pyramid):
+        self.pyramid = pyramid
+        self.start = 0
+        self.span = 0
+
+    def set_overlay(self, overlay):
+        self.overlay = overlay
+
+    def view(self):
+        # An unset span follows the whole take, e.g. while it is recorded.
+        total = self.total()
+        if self.span == 0:
+            return 0, max(total, 1)
+        return self.start, self.span
+
+    def clamp(self, start, span):
+        total = max(self.total(), MIN_SPAN)
+        span = int(np.clip(span, MIN_SPAN, total))
+        start = int(np.clip(start, 0, total - span))
+        self.start, self.span = start, span if span < total else 0
+
+    def zoom(self, factor, x):
+        start, span = self.view()
+        anchor = start + span * (x - self.rect.x) / self.rect.width
+        new_span = span * factor
+        self.clamp(anchor - new_span * (anchor - start) / span, new_span)
+
+    def scroll(self, dx):
+        start, span = self.view()
+        self.clamp(start - dx * span / self.rect.width, span)
+
+    def handle_event(self, event):
+        # Returns True when the view changed.
+        if event.type == pygame.MOUSEWHEEL:
+            x, y = pygame.mouse.get_pos()
+            if self.rect.collidepoint(x, y):
+                self.zoom(0.8 ** event.y, x)
+                return True
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.rect.collidepoint(event.pos):
+            self.drag_x = event.pos[0]
+        elif event.type == pygame.MOUSEBUTTONUP:
+            self.drag_x = None
+        elif event.type == pygame.MOUSEMOTION and self.drag_x is not None:
+            self.scroll(event.pos[0] - self.drag_x)
+            self.drag_x = event.pos[0]
+            return True
+        return False
+
+    def column_image(self, pyramid, start, span, color, image, outline=False):
+        mins, maxs = pyramid.peaks(start, start + span, self.rect.width)
+        height = self.rect.height
+        valid = ~np.isnan(mins)
+        middle = (height - 1) / 2
+        top = np.zeros(len(mins), dtype=int)
+        bottom = np.full(len(mins), -1)
+        top[valid] = np.round(middle - np.clip(maxs[valid], -1, 1) * middle).astype(int)
+        bottom[valid] = np.round(middle - np.clip(mins[valid], -1, 1) * middle).astype(int)
+        rows = np.arange(height)
+        if outline:
+            mask = (rows == top[:, None]) | (rows == bottom[:, None])
+        else:
+            mask = (rows >= top[:, None]) & (rows <= bottom[:, None])
+        image[mask] = color
+
+    def draw(self, screen):
+        image = np.empty((self.rect.width, self.rect.height, 3), dtype=np.uint8)
+        image[:] = WHITE
+        start, span = self.view()
+        image[:, self.rect.height // 2] = BORDER_COLOR
+        if self.pyramid is not None:
+            self.column_image(self.pyramid, start, span, WAVE_COLOR, image)
+        if self.overlay is not None:
+            # Only the envelope of the overlay, so the recording stays visible.
+            self.column_image(self.overlay, start, span, OVERLAY_COLOR, image, outline=True)
+        if self.cursor is not None and start <= self.cursor < start + span:
+            image[int((self.cursor - start) * self.rect.width / span)] = CURSOR_COLOR
+        screen.blit(pygame.surfarray.make_surface(image), self.rect)
+
+        pyramid = self.pyramid or self.overlay
+        if self.font is not None and pyramid is not None:
+            label = f"{start / pyramid.rate:.2f}s - {(start + span) / pyramid.rate:.2f}s"
+            text = self.font.render(label, True, LABEL_COLOR)
+            screen.blit(text, text.get_rect(topright=(self.rect.right - 6, self.rect.y + 4)))
+        pygame.draw.rect(screen, BORDER_COLOR, self.rect, 1)
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+CACHE_DIR = ".analysis_cache"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+HASH_CHUNK = 1024 * 1024
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class AnalysisCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, path, **params):
+        suffix = "_".join(f"{name}{params[name]}" for name in sorted(params))
+        return f"{file_digest(path)}_{suffix}" if suffix else file_digest(path)
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        entry = self.entry_dir(key)
+        meta_path = os.path.join(entry, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            arrays = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode="r")
+                      for name in meta["arrays"]}
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        os.utime(entry)
+        return meta, arrays
+
+    def put(self, key, arrays, **meta):
+        entry = self.entry_dir(key)
+        staging = tempfile.mkdtemp(dir=self.cache_dir, prefix=".staging-")
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(staging, f"{name}.npy"), arr)
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump({**meta, "arrays": list(arrays)}, f)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(staging, entry)
+        except OSError as e:
+            print(f"Error writing analysis cache entry {key}: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self.evict(keep=key)
+
+    def entry_size(self, entry):
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    def evict(self, keep=None):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self.entry_dir(key)
+            if key.startswith(".") or not os.path.isdir(entry):
+                continue
+            entries.append((os.path.getmtime(entry), key, self.entry_size(entry)))
+
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for key in os.listdir(self.cache_dir):
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
@@ -1,14 +1,16 @@
 import numpy as np
-import soundfile as sf
 import matplotlib.pyplot as plt
 from utils.pitch_data import get_closest_note
+from utils.audio_io import read_audio
 
-def get_note():
+def get_note(path="./data/F#3.wav", max_seconds=None):
     try:
-        x, fs = sf.read("./data/F#3.wav")
+        x, fs = read_audio(path, max_seconds)
     except FileNotFoundError:
         print("File not found. Please check the filename and try again.")
         exit()
+    if x.ndim > 1:
+        x = x.mean(axis=1)
     
     N = len(x)
     df = fs / N
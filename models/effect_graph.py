@@ -0,0 +1,327 @@
+import numpy as np
+import soundfile as sf
+from models.pitch_shifter import StreamingShift
+from utils.audio_io import AudioSink, file_blocks
+
+def db_to_gain(db: float):
+    return 10 ** (db / 20)
+
+class Node:
+    # Samples of output a node adds after its input ends (echoes, delays).
+    tail_length = 0
+
+    def reset(self):
+        pass
+
+    def process(self, *blocks):
+        raise NotImplementedError
+
+    def flush(self, *blocks):
+        return self.process(*blocks)
+
+    def output_length(self, *lengths):
+        # Output samples once inputs of these lengths are flushed through.
+        return max(lengths) + self.tail_length
+
+class ShiftNode(Node):
+    def __init__(self, shifter, semitones=0.0, stft=None):
+        self.shifter = shifter
+        self.semitones = semitones
+        self.stft = stft
+        self.reset()
+
+    def reset(self):
+        self.shift = StreamingShift(self.shifter, self.semitones, self.stft)
+
+    def process(self, block):
+        out = self.shift.process(block)
+        return out if out is not None else block[..., :0]
+
+    def output_length(self, length):
+        return self.shift.output_length(length)
+
+    def flush(self, block):
+        out = self.process(block)
+        tail = self.shift.flush()
+        return np.concatenate((out, tail), axis=-1) if tail is not None else out
+
+class DelayNode(Node):
+    def __init__(self, rate, delay_ms=0.0):
+        self.delay = int(round(rate * delay_ms / 1000))
+        self.tail_length = self.delay
+        self.reset()
+
+    def reset(self):
+        self.tail = None
+
+    def process(self, block):
+        if self.tail is None:
+            self.tail = np.zeros(block.shape[:-1] + (self.delay,), dtype=block.dtype)
+        buffer = np.concatenate((self.tail, block), axis=-1)
+        self.tail = buffer[..., block.shape[-1]:]
+        return buffer[..., :block.shape[-1]]
+
+    def flush(self, block):
+        out = np.concatenate((self.process(block), self.tail), axis=-1)
+        self.tail = self.tail[..., :0]
+        return out
+
+class PanGainNode(Node):
+    def __init__(self, gain_db=0.0, pan=None):
+        self.gain = db_to_gain(gain_db)
+        self.pan = pan
+
+    def process(self, block):
+        out = block * self.gain
+        if self.pan is None:
+            return out
+        # pydub's pan law: the near side is boosted by up to 3 dB while the
+        # far side drops to silence at a full pan.
+        boost = 2 ** abs(self.pan)
+        near, far = np.sqrt(boost), 2 - boost
+        left, right = (near, far) if self.pan < 0 else (far, near)
+        if out.shape[0] == 1:
+            out = np.repeat(out, 2, axis=0)
+        return out * np.array([left, right], dtype=out.dtype)[:, None]
+
+class ReverbNode(Node):
+    # Feed-forward echo taps, each a delayed and attenuated copy of the input.
+    def __init__(self, rate, delays_ms=(40, 60, 80), gains_db=(-15, -18, -21)):
+        self.delays = [int(round(rate * d / 1000)) for d in delays_ms]
+        self.gains = [db_to_gain(g) for g in gains_db]
+        self.length = max(self.delays)
+        self.tail_length = self.length
+        self.reset()
+
+    def reset(self):
+        self.history = None
+
+    def process(self, block):
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (self.length,), dtype=block.dtype)
+        n = block.shape[-1]
+        buffer = np.concatenate((self.history, block), axis=-1)
+        out = block.copy()
+        for delay, gain in zip(self.delays, self.gains):
+            out += gain * buffer[..., self.length - delay:self.length - delay + n]
+        self.history = buffer[..., -self.length:]
+        return out
+
+    def flush(self, block):
+        out = self.process(block)
+        if self.history is None:
+            return out
+        return np.concatenate((out, self.process(np.zeros_like(self.history))), axis=-1)
+
+class MixerNode(Node):
+    # Inputs may arrive with different latencies (e.g. a shifted branch next
+    # to a dry one), so each is buffered and only the common span is mixed.
+    def __init__(self, gain_db=0.0):
+        self.gain = db_to_gain(gain_db)
+        self.reset()
+
+    def reset(self):
+        self.pending = None
+
+    def mix(self, length):
+        channels = max(p.shape[0] for p in self.pending)
+        out = np.zeros((channels, length), dtype=np.float32)
+        for i, pending in enumerate(self.pending):
+            take = min(length, pending.shape[-1])
+            out[:, :take] += pending[:, :take]
+            self.pending[i] = pending[:, take:]
+        return out * self.gain
+
+    def add(self, blocks):
+        if self.pending is None:
+            self.pending = [block[..., :0] for block in blocks]
+        self.pending = [np.concatenate((p, b), axis=-1) for p, b in zip(self.pending, blocks)]
+
+    def process(self, *blocks):
+        self.add(blocks)
+        return self.mix(min(p.shape[-1] for p in self.pending))
+
+    def flush(self, *blocks):
+        self.add(blocks)
+        return self.mix(max(p.shape[-1] for p in self.pending))
+
+def build_node(kind, params, shifter, rate):
+    if kind == "shift":
+        return ShiftNode(shifter, **params)
+    if kind == "delay":
+        return DelayNode(rate, **params)
+    if kind == "reverb":
+        return ReverbNode(rate, **params)
+    if kind == "pan_gain":
+        return PanGainNode(**params)
+    if kind == "mix":
+        return MixerNode(**params)
+    raise ValueError(f"Unknown node type: {kind}")
+
+def resolve(value, params):
+    # Preset values can name a runtime parameter ("shift") or a parameter
+    # plus an offset (("third_below", -0.02)), e.g. for key-aware curves.
+    if isinstance(value, str):
+        return params[value]
+    if isinstance(value, tuple):
+        name, offset = value
+        return params[name] + offset
+    return value
+
+class EffectGraph:
+    def __init__(self, nodes, output):
+        # nodes is a list of (name, node, input names); "source" is the
+        # graph input. Every node runs once per block and its output is
+        # shared by all of its consumers.
+        self.nodes = self.sort(nodes)
+        self.output = output
+
+    @staticmethod
+    def sort(nodes):
+        by_name = {name: (name, node, inputs) for name, node, inputs in nodes}
+        ordered, done = [], {"source"}
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name not in by_name:
+                raise ValueError(f"Unknown node: {name}")
+            if name in path:
+                raise ValueError(f"Cycle through node: {name}")
+            for input_name in by_name[name][2]:
+                visit(input_name, path | {name})
+            done.add(name)
+            ordered.append(by_name[name])
+
+        for name in by_name:
+            visit(name, frozenset())
+        return ordered
+
+    @classmethod
+    def from_preset(cls, preset, shifter, rate, **params):
+        nodes = []
+        for spec in preset["nodes"]:
+            settings = {key: resolve(value, params) for key, value in spec.items()
+                        if key not in ("name", "type", "inputs")}
+            nodes.append((spec["name"], build_node(spec["type"], settings, shifter, rate), spec["inputs"]))
+        return cls(nodes, preset["output"])
+
+    def reset(self):
+        for _, node, _ in self.nodes:
+            node.reset()
+
+    def use_analysis(self, stft):
+        # Shift nodes fed straight from the graph input take its frames from
+        # a finished analysis of that input (PitchShifter.analyze_stft, which
+        # goes through the analysis cache) instead of running their own STFT.
+        # The same input must then be streamed through the graph.
+        for _, node, inputs in self.nodes:
+            if isinstance(node, ShiftNode) and inputs == ["source"]:
+                node.stft = stft
+                node.reset()
+
+    def tail_length(self):
+        # Longest run of output past the end of the input, over all paths.
+        tails = {"source": 0}
+        for name, node, inputs in self.nodes:
+            tails[name] = node.tail_length + max(tails[input_name] for input_name in inputs)
+        return tails[self.output]
+
+    def output_length(self, n):
+        lengths = {"source": n}
+        for name, node, inputs in self.nodes:
+            lengths[name] = node.output_length(*(lengths[input_name] for input_name in inputs))
+        return lengths[self.output]
+
+    def run(self, block, final):
+        values = {"source": np.asarray(block, dtype=np.float32)}
+        for name, node, inputs in self.nodes:
+            args = [values[input_name] for input_name in inputs]
+            out = node.flush(*args) if final else node.process(*args)
+            values[name] = out.astype(np.float32, copy=False)
+        return values[self.output]
+
+    def process(self, block):
+        return self.run(block, final=False)
+
+    def flush(self, channels=1):
+        return self.run(np.zeros((channels, 0), dtype=np.float32), final=True)
+
+    def stream(self, blocks):
+        self.reset()
+        channels = 1
+        for block in blocks:
+            channels = block.shape[0]
+            out = self.process(block)
+            if out.shape[-1]:
+                yield out
+        out = self.flush(channels)
+        if out.shape[-1]:
+            yield out
+
+    def render(self, y):
+        y = np.atleast_2d(y)
+        return np.concatenate(list(self.stream([y])), axis=-1)
+
+    def render_file(self, input_file, output_file):
+        # Blocks are encoded as they are produced; the format follows the
+        # output extension (.wav, .flac or .ogg).
+        sink = None
+        with sf.SoundFile(input_file) as f:
+            rate = f.samplerate
+        for block in self.stream(file_blocks(input_file)):
+            if sink is None:
+                sink = AudioSink(output_file, rate, block.shape[0])
+            sink.write(np.clip(block, -1, 1).T)
+        if sink is not None:
+            sink.close()
+
+def voice(name, source, semitones, delay_ms, gain_db, pan):
+    return [
+        {"name": f"{name}_shift", "type": "shift", "inputs": [source], "semitones": semitones},
+        {"name": f"{name}_delay", "type": "delay", "inputs": [f"{name}_shift"], "delay_ms": delay_ms},
+        {"name": name, "type": "pan_gain", "inputs": [f"{name}_delay"], "gain_db": gain_db, "pan": pan},
+    ]
+
+# name: (semitones, delay ms, gain dB, pan)
+CHORUS_VOICES = {
+    "chorus1": (0.12, 25, -5, -0.2),
+    "chorus2": (-0.15, 35, -6, 0.25),
+    "chorus3": (0.08, 18, -4, -0.15),
+    "chorus4": (-0.10, 28, -5, 0.2),
+    "chorus5": (0.18, 15, -7, -0.3),
+    "chorus6": (-0.08, 22, -6, 0.3),
+}
+
+HARMONIZER_VOICES = {
+    "lower": (("third_below", -0.02), 10, -6, -0.3),
+    "upper": (("third_above", -0.02), 15, -5, 0.3),
+    "fifth": (("fifth_above", 0.02), 20, -7, -0.15),
+    "octave": (11.98, 25, -8, 0.15),
+    "lower_detune": (("third_below", -0.08), 20, -9, -0.4),
+    "upper_detune": (("third_above", 0.04), 30, -9, 0.4),
+}
+
+PRESETS = {
+    "chorus": {
+        "output": "out",
+        "nodes": [
+            {"name": "shifted", "type": "shift", "inputs": ["source"], "semitones": "shift"},
+            {"name": "dry", "type": "pan_gain", "inputs": ["shifted"], "gain_db": -2},
+            *[node for name, args in CHORUS_VOICES.items() for node in voice(name, "shifted", *args)],
+            {"name": "out", "type": "mix", "inputs": ["dry", *CHORUS_VOICES], "gain_db": 2},
+        ],
+    },
+    "harmonizer": {
+        "output": "out",
+        "nodes": [
+            {"name": "shifted", "type": "shift", "inputs": ["source"], "semitones": "shift"},
+            {"name": "dry", "type": "pan_gain", "inputs": ["shifted"], "gain_db": -2},
+            *[node for name, args in HARMONIZER_VOICES.items() for node in voice(name, "shifted", *args)],
+            {"name": "voices", "type": "mix", "inputs": ["dry", *HARMONIZER_VOICES]},
+            {"name": "reverb", "type": "reverb", "inputs": ["voices"],
+             "delays_ms": [40, 60, 80], "gains_db": [-15, -18, -21]},
+            {"name": "out", "type": "pan_gain", "inputs": ["reverb"], "gain_db": 4},
+        ],
+    },
+}
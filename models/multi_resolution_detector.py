@@ -0,0 +1,87 @@
+import numpy as np
+from utils.pitch_data import get_closest_note
+from models.voice_activity import spectral_flatness
+
+RATE = 44100
+WINDOW_SIZES = (1024, 2048, 4096, 8192)
+HOP = 1024
+MIN_CYCLES = 10
+
+class MultiResolutionPitchDetector:
+    def __init__(self, sizes=WINDOW_SIZES, hop=HOP, rate=RATE, min_cycles=MIN_CYCLES):
+        self.sizes = sorted(sizes)
+        self.hop = hop
+        self.rate = rate
+        self.min_cycles = min_cycles
+        self.ring = np.zeros(self.sizes[-1])
+        self.write_pos = 0
+        self.filled = 0
+        self.pending = 0
+        self.windows = {n: np.hanning(n) for n in self.sizes}
+        self.freqs = {n: rate / n * np.arange(n // 2) for n in self.sizes}
+
+    def reset(self):
+        self.ring[:] = 0
+        self.write_pos = 0
+        self.filled = 0
+        self.pending = 0
+
+    def latest(self, n: int):
+        idx = (self.write_pos - n + np.arange(n)) % len(self.ring)
+        return self.ring[idx]
+
+    def write(self, samples: np.ndarray):
+        samples = samples[-len(self.ring):]
+        idx = (self.write_pos + np.arange(len(samples))) % len(self.ring)
+        self.ring[idx] = samples
+        self.write_pos = (self.write_pos + len(samples)) % len(self.ring)
+        self.filled = min(self.filled + len(samples), len(self.ring))
+
+    def estimate(self, n: int):
+        w = self.windows[n]
+        X = np.fft.rfft(w * self.latest(n))
+        Xpos = np.sqrt(np.mean(w ** 2)) * np.abs(2 * X[:n // 2]) / n
+        XdB = 20 * np.log10(np.maximum(Xpos, np.finfo(float).tiny))
+
+        # Parabolic interpolation of the log-magnitude peak recovers most of
+        # the resolution lost by the short windows.
+        k = int(np.argmax(XdB[1:-1])) + 1
+        a, b, c = XdB[k - 1], XdB[k], XdB[k + 1]
+        denom = a - 2 * b + c
+        offset = 0.5 * (a - c) / denom if denom != 0 else 0.0
+        freq = (k + offset) * self.rate / n
+        return freq, XdB, Xpos ** 2
+
+    def analyse(self):
+        # Walk from the shortest window up and stop at the first one whose
+        # estimate spans at least min_cycles periods: high notes are settled
+        # by the 23 ms window, low notes fall through to the longer ones.
+        available = [n for n in self.sizes if n <= self.filled] or self.sizes[:1]
+        for n in available:
+            freq, XdB, power = self.estimate(n)
+            if freq * n / self.rate >= self.min_cycles:
+                break
+        XdB_min = np.min(XdB)
+        XdB_range = np.max(XdB) - XdB_min
+        normalized = (XdB - XdB_min) / XdB_range if XdB_range > 0 else np.zeros_like(XdB)
+        return {
+            "note": get_closest_note(freq),
+            "freq": freq,
+            "window": n,
+            "latency": n / self.rate,
+            "flatness": spectral_flatness(power),
+            "spectrum": (self.freqs[n], normalized),
+        }
+
+    def push(self, samples: np.ndarray):
+        results = []
+        samples = np.asarray(samples, dtype=float)
+        while len(samples):
+            take = min(len(samples), self.hop - self.pending)
+            self.write(samples[:take])
+            samples = samples[take:]
+            self.pending += take
+            if self.pending == self.hop:
+                self.pending = 0
+                results.append(self.analyse())
+        return results
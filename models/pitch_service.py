@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from models.real_time_pitch_detector import analyze_frames, CHUNK
+from models.voice_activity import VoiceActivityDetector
+from utils.pitch_data import get_closest_note, cents_from_note
+
+HOST = "127.0.0.1"
+PORT = 8765
+WINDOW = CHUNK
+HOP = CHUNK // 2
+MAX_IN_FLIGHT = 4
+MAX_BATCH = 256
+
+# Protocol: a client streams raw little-endian int16 mono PCM at 44.1 kHz.
+# For every HOP samples received the server answers with one JSON line
+# {"hop", "note", "freq", "cents", "confidence"}; note is null for silence.
+
+class PitchService:
+    def __init__(self, window=WINDOW, hop=HOP, max_in_flight=MAX_IN_FLIGHT, max_batch=MAX_BATCH):
+        self.window = window
+        self.hop = hop
+        self.max_in_flight = max_in_flight
+        self.max_batch = max_batch
+        self.pending = []
+        self.ready = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.clients = 0
+        self.batches = 0
+        self.batched_frames = 0
+
+    def submit(self, frame: np.ndarray):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((frame, future))
+        self.ready.set()
+        return future
+
+    async def batch_loop(self):
+        # One rfft call covers every client whose hop is ready. While a batch
+        # runs in the executor the loop keeps reading sockets, so the next
+        # batch naturally grows with the number of busy clients.
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.pending:
+                batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+                frames = np.stack([frame for frame, _ in batch])
+                try:
+                    _, max_freqs, confidences, flatness, _ = await loop.run_in_executor(
+                        self.executor, analyze_frames, frames)
+                except Exception as e:
+                    print(f"Error analysing batch: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), freq, confidence, flat in zip(batch, max_freqs, confidences, flatness):
+                    if not future.done():
+                        future.set_result((freq, confidence, flat))
+                self.batches += 1
+                self.batched_frames += len(batch)
+
+    async def respond(self, hops, writer):
+        # Hops are gated, analysed and confirmed strictly in order: the VAD's
+        # level gate for a hop depends on the flatness check of the one
+        # before it, so a hop is only gated once the previous reply is known.
+        # Clients still share batches with each other.
+        vad = VoiceActivityDetector()
+        connected = True
+        while True:
+            item = await hops.get()
+            if item is None:
+                break
+            index, window = item
+            reply = {"hop": index, "note": None, "freq": None, "cents": None, "confidence": 0.0}
+            if vad.update(window[None, -self.hop:])[0]:
+                freq, confidence, flatness = await self.submit(window)
+                if vad.confirm([flatness])[0]:
+                    note = get_closest_note(freq)
+                    reply.update(note=note, freq=round(float(freq), 2),
+                                 cents=round(float(cents_from_note(freq, note)), 1),
+                                 confidence=round(float(confidence), 3))
+            if not connected:
+                continue
+            try:
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+            except ConnectionError:
+                connected = False
+
+    async def run_responder(self, hops, writer):
+        try:
+            await self.respond(hops, writer)
+        except Exception as e:
+            # Close the connection and keep draining, so the reader is never
+            # left blocked on a full queue nobody consumes.
+            print(f"Error answering client: {e}")
+            writer.close()
+            while await hops.get() is not None:
+                pass
+
+    async def handle_client(self, reader, writer):
+        self.clients += 1
+        window = np.zeros(self.window)
+        hops = asyncio.Queue(self.max_in_flight)
+        responder = asyncio.create_task(self.run_responder(hops, writer))
+        index = 0
+        try:
+            while True:
+                data = await reader.readexactly(self.hop * 2)
+                samples = np.frombuffer(data, dtype="<i2").astype(float)
+                window = np.concatenate((window[self.hop:], samples))
+                # Backpressure: once max_in_flight hops are unanswered this put
+                # blocks, the socket stops being read and TCP slows the sender.
+                await hops.put((index, window))
+                index += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            await hops.put(None)
+            await responder
+            writer.close()
+            self.clients -= 1
+
+    def stats(self):
+        return {"clients": self.clients, "batches": self.batches,
+                "mean_batch": self.batched_frames / self.batches if self.batches else 0.0}
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        batcher = asyncio.create_task(self.batch_loop())
+        print(f"Pitch service listening on {host}:{port}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            print(f"Pitch service stats: {self.stats()}", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Local pitch-detection service")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(PitchService().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,389 @@
 import librosa
 import numpy as np
 import soundfile as sf
+from models.resampler import PolyphaseResampler, VariableResampler, resample, resample_at
+from utils.audio_io import file_blocks
+
+SEGMENT_FRAMES = 16
+ANALYSIS_BLOCK = 1 << 16
+
+class OverlapAdd:
+    def __init__(self, n_fft: int, hop: int, shape: tuple = ()):
+        self.n_fft = n_fft
+        self.hop = hop
+        self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)
+        self.buffer = np.zeros(shape + (n_fft,))
+        self.norm = np.zeros(n_fft)
+        self.trim = n_fft // 2
+        self.num_frames = 0
+
+    def emit(self, count: int):
+        out = self.buffer[..., :count].copy()
+        norm = self.norm[:count]
+        nonzero = norm > np.finfo(norm.dtype).tiny
+        out[..., nonzero] /= norm[nonzero]
+        self.buffer = np.concatenate((self.buffer[..., count:], np.zeros(self.buffer.shape[:-1] + (count,))), axis=-1)
+        self.norm = np.concatenate((self.norm[count:], np.zeros(count)))
+        if self.trim:
+            skip = min(self.trim, count)
+            self.trim -= skip
+            out = out[..., skip:]
+        return out
+
+    def process(self, stft_frames: np.ndarray):
+        frames = np.fft.irfft(stft_frames, n=self.n_fft, axis=-2) * self.window[:, None]
+        blocks = []
+        for t in range(frames.shape[-1]):
+            self.buffer += frames[..., t]
+            self.norm += self.window ** 2
+            blocks.append(self.emit(self.hop))
+            self.num_frames += 1
+        return np.concatenate(blocks, axis=-1) if blocks else self.buffer[..., :0]
+
+    def flush(self):
+        # Matches librosa.istft(center=True): the centred padding is trimmed
+        # from both ends, leaving hop * (num_frames - 1) samples in total.
+        return self.emit(self.n_fft // 2 - self.hop) if self.num_frames else self.buffer[..., :0]
+
+class StreamingSTFT:
+    def __init__(self, n_fft: int, hop: int):
+        self.n_fft = n_fft
+        self.hop = hop
+        self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)
+        self.buffer = None
+        self.total = 0
+        self.num_frames = 0
+
+    def frames(self, count: int):
+        if count <= 0:
+            return np.zeros(self.buffer.shape[:-1] + (self.n_fft // 2 + 1, 0), dtype=complex)
+        starts = np.arange(count) * self.hop
+        segments = self.buffer[..., starts[:, None] + np.arange(self.n_fft)] * self.window
+        self.buffer = self.buffer[..., count * self.hop:]
+        self.num_frames += count
+        return np.moveaxis(np.fft.rfft(segments, axis=-1), -1, -2)
+
+    def process(self, block: np.ndarray):
+        # Same frames as librosa.stft(center=True): the signal is zero-padded
+        # by n_fft // 2 at the start, and a frame is emitted once it is full.
+        if self.buffer is None:
+            self.buffer = np.zeros(block.shape[:-1] + (self.n_fft // 2,))
+        self.buffer = np.concatenate((self.buffer, block), axis=-1)
+        self.total += block.shape[-1]
+        return self.frames((self.buffer.shape[-1] - self.n_fft) // self.hop + 1)
+
+    def flush(self):
+        if self.buffer is None:
+            return None
+        self.buffer = np.concatenate((self.buffer, np.zeros(self.buffer.shape[:-1] + (self.n_fft,))), axis=-1)
+        return self.frames(1 + self.total // self.hop - self.num_frames)
+
+class PrecomputedSTFT:
+    # Hands out frames of a finished analysis (PitchShifter.analyze_stft) in
+    # step with the samples streamed, exactly as StreamingSTFT would emit
+    # them, so a cached analysis can stand in for the live one.
+    def __init__(self, stft: np.ndarray, n_fft: int, hop: int):
+        self.stft = stft
+        self.n_fft = n_fft
+        self.hop = hop
+        self.total = 0
+        self.num_frames = 0
+
+    def frames(self, count: int):
+        out = self.stft[..., self.num_frames:self.num_frames + max(count, 0)]
+        self.num_frames += out.shape[-1]
+        return out
+
+    def process(self, block: np.ndarray):
+        self.total += block.shape[-1]
+        return self.frames((self.total + self.n_fft // 2 - self.n_fft) // self.hop + 1 - self.num_frames)
+
+    def flush(self):
+        return self.frames(1 + self.total // self.hop - self.num_frames)
+
+class StreamingShift:
+    # Block-in, block-out version of PitchShifter.shift_pitch. semitones is a
+    # fixed shift or a curve, read as in PitchShifter.ratio_curve. Output
+    # stays at the input rate. stft, when given, is the input's analysis
+    # from PitchShifter.analyze_stft and replaces the live one.
+    def __init__(self, shifter, semitones, stft=None):
+        self.shifter = shifter
+        self.stft = stft
+        self.hop = shifter.hop_len
+        self.semitones = semitones
+        self.curve = None if np.ndim(semitones) == 0 else 2 ** (np.asarray(semitones, dtype=float) / 12)
+        self.scaling = 2 ** (semitones / 12) if self.curve is None else None
+        self.reset()
+
+    def reset(self):
+        if self.stft is None:
+            self.analysis = StreamingSTFT(self.shifter.w_len, self.hop)
+        else:
+            self.analysis = PrecomputedSTFT(self.stft, self.shifter.w_len, self.hop)
+        self.synth = None
+        if self.curve is None:
+            self.resampler = PolyphaseResampler.for_ratio(1 / self.scaling)
+        else:
+            self.resampler = VariableResampler(max_step=np.max(self.curve))
+        self.magnitude = None
+        self.phases = None
+        self.phase_diffs = None
+        self.frame_base = 0
+        self.last_phases = None
+        self.stretched = np.zeros(1)
+        self.next_frame = 0
+        self.next_sample = 0
+        self.prev = None
+
+    def add_frames(self, X: np.ndarray):
+        if X is None or X.shape[-1] == 0:
+            return
+        magnitude = np.abs(X)
+        phases = np.angle(X)
+        previous = np.zeros(X.shape[:-1] + (1,)) if self.last_phases is None else self.last_phases[..., None]
+        phase_diffs = np.mod(phases - np.concatenate((previous, phases[..., :-1]), axis=-1), np.pi * 2)
+        self.last_phases = phases[..., -1]
+
+        if self.magnitude is None:
+            self.magnitude, self.phases, self.phase_diffs = magnitude, phases, phase_diffs
+        else:
+            self.magnitude = np.concatenate((self.magnitude, magnitude), axis=-1)
+            self.phases = np.concatenate((self.phases, phases), axis=-1)
+            self.phase_diffs = np.concatenate((self.phase_diffs, phase_diffs), axis=-1)
+
+        first = len(self.stretched) - 1
+        frames = np.arange(first, first + X.shape[-1])
+        ratios = np.full(len(frames), self.scaling) if self.curve is None else \
+            self.shifter.ratio_curve(self.semitones, frames[-1] + 1, first)
+        self.stretched = np.concatenate((self.stretched, self.stretched[-1] + np.cumsum(ratios)))
+
+    def render(self, final: bool):
+        if self.magnitude is None:
+            return None
+        num_frames = len(self.stretched) - 1
+        frame_axis = np.arange(num_frames + 1)
+        # Output frame j reads input frame idx(j); until the input ends only
+        # frames whose interpolation neighbours have arrived can be shifted.
+        if final:
+            count = int(np.floor(self.stretched[-1]))
+        else:
+            count = int(np.ceil(np.interp(num_frames - 1.5, frame_axis, self.stretched)))
+        idxs = np.interp(np.arange(self.next_frame, max(count, self.next_frame)), self.stretched, frame_axis)
+        idxs = np.minimum(idxs, num_frames - 1)
+
+        blocks = []
+        if len(idxs):
+            local = idxs - self.frame_base
+            shifted_magnitude, shifted_phases = self.shifter.shift_frames(
+                local, self.magnitude, self.phases, self.phase_diffs, self.prev)
+            self.prev = (shifted_magnitude[..., -1], shifted_phases[..., -1])
+            if self.synth is None:
+                self.synth = OverlapAdd(self.shifter.w_len, self.hop, self.magnitude.shape[:-2])
+            blocks.append(self.synth.process(shifted_magnitude * np.exp(shifted_phases * 1j)))
+            self.next_frame += len(idxs)
+
+            drop = max(int(idxs[-1]) - 1 - self.frame_base, 0)
+            self.magnitude = self.magnitude[..., drop:]
+            self.phases = self.phases[..., drop:]
+            self.phase_diffs = self.phase_diffs[..., drop:]
+            self.frame_base += drop
+        if final and self.synth is not None:
+            blocks.append(self.synth.flush())
+
+        wave = np.concatenate(blocks, axis=-1) if blocks else np.zeros(self.magnitude.shape[:-2] + (0,))
+        if self.curve is None:
+            out = self.resampler.process(wave)
+            return np.concatenate((out, self.resampler.flush()), axis=-1) if final else out
+
+        # Output sample k sits at stretched(k / hop) * hop in the stretched
+        # signal, as in shift_pitch; the last input frame is only final at
+        # the end, so positions are released a few frames behind.
+        limit = self.hop * (num_frames - 1) if final else self.hop * max(num_frames - 4, 0)
+        if limit > self.next_sample:
+            positions = np.interp(np.arange(self.next_sample, limit) / self.hop, frame_axis, self.stretched) * self.hop
+            if final:
+                total = self.hop * (self.next_frame - 1)
+                positions = np.minimum(positions, total - 1)
+            self.resampler.extend(positions)
+            self.next_sample = limit
+        out = self.resampler.process(wave)
+        return np.concatenate((out, self.resampler.flush()), axis=-1) if final else out
+
+    def output_length(self, n: int):
+        # Length of the render of an n-sample input, without rendering it:
+        # 1 + n // hop analysis frames, stretched, overlap-added and resampled.
+        frames = 1 + n // self.hop
+        if self.curve is not None:
+            return self.hop * (frames - 1)
+        stretched = self.hop * max(int(np.floor(frames * self.scaling)) - 1, 0)
+        return -(-stretched * self.resampler.up // self.resampler.down)
+
+    def process(self, block: np.ndarray):
+        self.add_frames(self.analysis.process(np.asarray(block, dtype=float)))
+        return self.render(final=False)
+
+    def flush(self):
+        self.add_frames(self.analysis.flush())
+        return self.render(final=True)
 
 class PitchShifter:
-    def __init__(self):
+    def __init__(self, cache=None):
         self.sr = None
         self.w_len = 1024 * 4
+        self.hop_len = self.w_len // 4
+        self.cache = cache
 
     def interpolate_time(self, idxs: np.ndarray, arr: np.ndarray):
         start = (idxs + 0.5).astype(int)
         frac = (idxs - start)
-        shifted_arr = np.concatenate((arr[:, 1:], np.zeros((arr.shape[0], 1))), axis=1)
-        return arr[:, start] * (1 - frac) + shifted_arr[:, start] * frac
+        next_vals = np.where(start + 1 < arr.shape[-1], arr[..., np.minimum(start + 1, arr.shape[-1] - 1)], 0)
+        return arr[..., start] * (1 - frac) + next_vals * frac
 
     def round_interpolate_time(self, idxs: np.ndarray, arr: np.ndarray):
-        return arr[:, (idxs + 0.5).astype(int)]
+        return arr[..., (idxs + 0.5).astype(int)]
 
-    def shift_pitch(self, input_file: str, output_file: str, semitones: float):
-        y, self.sr = librosa.load(input_file, sr=None, mono=True)
-        X = librosa.stft(y, n_fft=self.w_len, win_length=self.w_len)
-        num_freqs, num_frames = X.shape
-        scaling = 2 ** (semitones / 12)
-        updated_num_frames = np.floor(num_frames * scaling).astype(int)
-        updated_t_frames = np.arange(updated_num_frames)
-        original_indices = np.minimum(updated_t_frames / scaling, num_frames - 1)
+    def analyze_stft(self, input_file: str):
+        # Complex STFT as (channels, bins, frames). It is kept as complex64:
+        # synthesis does not need more, and the cache entry is a third of
+        # the size of float64 magnitude, phase and phase-difference arrays.
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(input_file, n_fft=self.w_len, hop=self.hop_len, stft="complex64")
+            cached = self.cache.get(key)
+            if cached is not None:
+                meta, arrays = cached
+                self.sr = meta["sr"]
+                return arrays["stft"]
+
+        # The file (WAV, FLAC or Ogg) is decoded block by block straight into
+        # the STFT, so only the spectrogram is ever held in memory.
+        # Multichannel input is kept as (channels, samples) so every channel
+        # goes through the same batched STFT and phase vocoder loop.
+        self.sr = sf.info(input_file).samplerate
+        stft = StreamingSTFT(self.w_len, self.hop_len)
+        frames = [stft.process(block) for block in file_blocks(input_file, ANALYSIS_BLOCK)]
+        X = np.concatenate(frames + [stft.flush()], axis=-1).astype(np.complex64)
+        if key is not None:
+            self.cache.put(key, {"stft": X}, sr=self.sr)
+        return X
+
+    def analyze(self, input_file: str):
+        X = self.analyze_stft(input_file)
+        if X.shape[0] == 1:
+            X = X[0]
         magnitude = np.abs(X)
         phases = np.angle(X)
-        phase_diffs = phases - np.concatenate((np.zeros((num_freqs, 1)), phases[:, :-1]), axis=1)
+        phase_diffs = phases - np.concatenate((np.zeros(X.shape[:-1] + (1,), dtype=phases.dtype), phases[..., :-1]),
+                                              axis=-1)
         phase_diffs = np.mod(phase_diffs, np.pi * 2)
-        shifted_magnitude = self.interpolate_time(original_indices, magnitude)
-        shifted_phase_diffs = self.interpolate_time(original_indices, phase_diffs)
-        unshifted_phases = self.round_interpolate_time(original_indices, phases)
-        shifted_phases = np.zeros((num_freqs, updated_num_frames))
-        shifted_phases[:, 0] = shifted_phase_diffs[:, 0]
-
-        for t in range(1, updated_num_frames):
-            time_phases = shifted_phases[:, t - 1] + shifted_phase_diffs[:, t]
-            freq_phases = unshifted_phases[:, t]
-            transient = (shifted_magnitude[:, t] - shifted_magnitude[:, t - 1]) / (shifted_magnitude[:, t] + shifted_magnitude[:, t - 1])
+        return magnitude, phases, phase_diffs
+
+    def shift_frames(self, idxs: np.ndarray, magnitude, phases, phase_diffs, prev=None):
+        shifted_magnitude = self.interpolate_time(idxs, magnitude)
+        shifted_phase_diffs = self.interpolate_time(idxs, phase_diffs)
+        unshifted_phases = self.round_interpolate_time(idxs, phases)
+        shifted_phases = np.zeros(shifted_magnitude.shape)
+
+        # Continuing a previous segment: its last frame is prepended so the
+        # phase accumulation carries on exactly where it stopped.
+        if prev is None:
+            shifted_phases[..., 0] = shifted_phase_diffs[..., 0]
+        else:
+            prev_magnitude, prev_phases = prev
+            shifted_magnitude = np.concatenate((prev_magnitude[..., None], shifted_magnitude), axis=-1)
+            shifted_phase_diffs = np.concatenate((np.zeros(prev_phases.shape + (1,)), shifted_phase_diffs), axis=-1)
+            unshifted_phases = np.concatenate((prev_phases[..., None], unshifted_phases), axis=-1)
+            shifted_phases = np.concatenate((prev_phases[..., None], shifted_phases), axis=-1)
+
+        for t in range(1, shifted_phases.shape[-1]):
+            time_phases = shifted_phases[..., t - 1] + shifted_phase_diffs[..., t]
+            freq_phases = unshifted_phases[..., t]
+            transient = (shifted_magnitude[..., t] - shifted_magnitude[..., t - 1]) / (shifted_magnitude[..., t] + shifted_magnitude[..., t - 1])
             transient[transient < 0.5] = 0
             transient[transient >= 0.5] = 1
-            shifted_phases[:, t] = np.mod(freq_phases * transient + time_phases * (1 - transient), np.pi * 2)
+            shifted_phases[..., t] = np.mod(freq_phases * transient + time_phases * (1 - transient), np.pi * 2)
+
+        if prev is not None:
+            shifted_magnitude = shifted_magnitude[..., 1:]
+            shifted_phases = shifted_phases[..., 1:]
+        return shifted_magnitude, shifted_phases
+
+    def ratio_curve(self, semitones, num_frames: int, first: int = 0):
+        # Pitch ratios for analysis frames first..num_frames - 1. A curve has
+        # one value per input analysis frame and is never stretched: its last
+        # value is held past its end and extra values are ignored. shift_pitch
+        # and StreamingShift both read curves through here.
+        curve = 2 ** (np.asarray(semitones, dtype=float) / 12)
+        if curve.size == 1:
+            return np.full(num_frames - first, float(curve))
+        return curve[np.minimum(np.arange(first, num_frames), curve.size - 1)]
+
+    def frame_frequencies(self, input_file: str, min_level: float = 0.05):
+        magnitude, _, _ = self.analyze(input_file)
+        spectrum = np.asarray(magnitude)
+        if spectrum.ndim > 2:
+            spectrum = spectrum.reshape(-1, *spectrum.shape[-2:]).mean(axis=0)
+        # Bins are sr / w_len apart (about 11 Hz), more than a semitone for
+        # low voices, so the peak is refined by parabolic interpolation of
+        # the log magnitude, as in MultiResolutionPitchDetector.estimate.
+        k = np.argmax(spectrum[1:-1], axis=0) + 1
+        a, b, c = np.log(np.maximum(np.take_along_axis(spectrum, k + np.arange(-1, 2)[:, None], axis=0),
+                                    np.finfo(float).tiny))
+        denom = a - 2 * b + c
+        offset = np.divide(0.5 * (a - c), denom, out=np.zeros_like(denom), where=denom != 0)
+        peaks = np.max(spectrum, axis=0)
+        freqs = (k + offset) * self.sr / self.w_len
+        freqs[peaks < min_level * np.max(peaks)] = 0
+        return freqs
+
+    def shift_pitch(self, input_file: str, output_file: str, semitones):
+        # semitones is either a fixed shift or a curve over the input analysis
+        # frames (see ratio_curve). A curve is rendered in the same single pass: the
+        # stretch reads the input at a varying rate and the output is resampled
+        # back at the matching varying rate, so phase stays continuous.
+        magnitude, phases, phase_diffs = self.analyze(input_file)
+        num_frames = magnitude.shape[-1]
+        if np.ndim(semitones) == 0:
+            scaling = 2 ** (semitones / 12)
+            updated_num_frames = np.floor(num_frames * scaling).astype(int)
+            updated_t_frames = np.arange(updated_num_frames)
+            original_indices = np.minimum(updated_t_frames / scaling, num_frames - 1)
+        else:
+            curve = self.ratio_curve(semitones, num_frames)
+            stretched = np.concatenate(([0], np.cumsum(curve)))
+            updated_num_frames = int(np.floor(stretched[-1]))
+            original_indices = np.minimum(np.interp(np.arange(updated_num_frames), stretched, np.arange(num_frames + 1)),
+                                          num_frames - 1)
+        shifted_magnitude, shifted_phases = self.shift_frames(original_indices, magnitude, phases, phase_diffs)
 
         synth_stft = shifted_magnitude * np.exp(shifted_phases * 1j)
-        new_waveform = librosa.istft(synth_stft, n_fft=self.w_len, window="hann")
-        sf.write(output_file, new_waveform, int(self.sr * scaling))
+        new_waveform = librosa.istft(synth_stft, n_fft=self.w_len, hop_length=self.hop_len, window="hann")
+        if np.ndim(semitones) == 0:
+            new_waveform = resample(new_waveform, 1 / scaling)
+        else:
+            output_frames = np.arange(self.hop_len * (num_frames - 1)) / self.hop_len
+            positions = np.interp(output_frames, np.arange(num_frames + 1), stretched) * self.hop_len
+            positions = np.minimum(positions, new_waveform.shape[-1] - 1)
+            new_waveform = resample_at(new_waveform, positions, max_step=np.max(curve))
+        sf.write(output_file, new_waveform.T, self.sr)
+
+    def render_segments(self, input_file: str, semitones: float, segment_frames: int = SEGMENT_FRAMES):
+        magnitude, phases, phase_diffs = self.analyze(input_file)
+        num_frames = magnitude.shape[-1]
+        scaling = 2 ** (semitones / 12)
+        updated_num_frames = int(np.floor(num_frames * scaling))
+        original_indices = np.minimum(np.arange(updated_num_frames) / scaling, num_frames - 1)
+
+        synth = OverlapAdd(self.w_len, self.hop_len, magnitude.shape[:-2])
+        resampler = PolyphaseResampler.for_ratio(1 / scaling)
+        prev = None
+        for seg_start in range(0, updated_num_frames, segment_frames):
+            idxs = original_indices[seg_start:seg_start + segment_frames]
+            shifted_magnitude, shifted_phases = self.shift_frames(idxs, magnitude, phases, phase_diffs, prev)
+            prev = (shifted_magnitude[..., -1], shifted_phases[..., -1])
+            block = resampler.process(synth.process(shifted_magnitude * np.exp(shifted_phases * 1j)))
+            if block.shape[-1]:
+                yield block
+        tail = np.concatenate((resampler.process(synth.flush()), resampler.flush()), axis=-1)
+        if tail.shape[-1]:
+            yield tail
@@ -0,0 +1,62 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from utils.pitch_data import get_closest_notes
+
+FRAME = 4096
+HOP = 1024
+BATCH_FRAMES = 128
+SILENCE_DB = -50.0
+MAX_CHANNELS = 8
+
+def track_pitch(y, sr, frame=FRAME, hop=HOP, silence_db=SILENCE_DB, batch_frames=BATCH_FRAMES):
+    # Whole-file pitch track. y is (samples,) or (channels, samples), as
+    # file_blocks yields, int16 or float; channels are mixed down. The frame
+    # matrix is a strided view of y itself: conversion, scaling and the
+    # mixdown happen per batch of batch_frames frames, so memory stays
+    # bounded for hour-long input. Each batch is one rfft call, small enough
+    # to stay in cache.
+    # Returns frame centre times in seconds, peak frequencies (NaN where the
+    # frame is below silence_db or mostly padding) and note names (None
+    # there).
+    y = np.asarray(y)
+    if y.ndim == 1:
+        y = y[None, :]
+    if y.ndim != 2 or y.shape[0] > MAX_CHANNELS:
+        raise ValueError(f"Expected (samples,) or (channels, samples) with at most {MAX_CHANNELS} channels, "
+                         f"got shape {y.shape}")
+    dtype = y.dtype if np.issubdtype(y.dtype, np.floating) else np.dtype(np.float32)
+    scale = 1 / 32768 if np.issubdtype(y.dtype, np.integer) else 1.0
+    gain = scale / y.shape[0]
+    samples = y.shape[-1]
+    if samples < frame:
+        y = np.pad(y, ((0, 0), (0, frame - y.shape[-1])))
+    frames = sliding_window_view(y, frame, axis=-1)[:, ::hop]
+    window = (np.hanning(frame) * gain).astype(dtype)
+    freqs = np.empty(frames.shape[1])
+
+    for first in range(0, len(freqs), batch_frames):
+        batch = frames[:, first:first + batch_frames]
+        mixed = batch[0].astype(dtype) if len(batch) == 1 else batch.sum(axis=0, dtype=dtype)
+        X = np.fft.rfft(mixed * window, axis=-1)
+        power = X.real ** 2 + X.imag ** 2
+
+        # Parabolic interpolation of the log-power peak, as in
+        # MultiResolutionPitchDetector.estimate, for every frame at once;
+        # only the three bins around each peak need a log.
+        k = np.argmax(power[:, 1:-1], axis=-1) + 1
+        a, b, c = np.log(np.maximum(np.take_along_axis(power, k[:, None] + np.arange(-1, 2), axis=-1),
+                                    np.finfo(power.dtype).tiny)).T
+        denom = a - 2 * b + c
+        offset = np.divide(0.5 * (a - c), denom, out=np.zeros_like(denom), where=denom != 0)
+        estimate = (k + offset) * sr / frame
+
+        level = 10 * np.log10(np.maximum(np.einsum("ij,ij->i", mixed, mixed) * gain ** 2 / frame, 1e-20))
+        estimate[level < silence_db] = np.nan
+        freqs[first:first + len(mixed)] = estimate
+
+    # Input shorter than a frame is zero-padded; a frame centred in the
+    # padding has no pitch.
+    centres = np.arange(len(freqs)) * hop + frame / 2
+    freqs[centres > samples] = np.nan
+    times = centres / sr
+    return times, freqs, get_closest_notes(freqs)
@@ -1,4 +1,5 @@
 from utils.pitch_data import get_closest_note
+from models.voice_activity import VoiceActivityDetector, spectral_flatness
 import pyaudio
 import numpy as np
 
@@ -7,37 +8,118 @@ FORMAT = pyaudio.paInt16
 CHANNELS = 1
 CHUNK = 1024 * 4
 
-THRESHOLD = 700 
+PEAK_BINS = 2
 
-def detect_pitch(stream):
-    data = stream.read(CHUNK)
-    audio_data = np.frombuffer(data, dtype=np.int16)
+default_vads = {}
 
-    if np.max(np.abs(audio_data)) < THRESHOLD:
-        return None, None, None
+class InputXruns:
+    def __init__(self):
+        self.overflows = 0
+
+    def reset(self):
+        self.overflows = 0
+
+def get_default_vad(channels=CHANNELS):
+    if channels not in default_vads:
+        default_vads[channels] = VoiceActivityDetector(channels)
+    return default_vads[channels]
 
-    N = len(audio_data)
+def read_input(stream, num_frames, xruns=None):
+    # An overflow means the device dropped frames while we were busy. They
+    # are gone either way, so it is counted and the next frames are read
+    # instead of letting the error end the caller's loop.
+    try:
+        return stream.read(num_frames)
+    except OSError as e:
+        if e.errno != pyaudio.paInputOverflowed:
+            raise
+        if xruns is not None:
+            xruns.overflows += 1
+        return stream.read(num_frames, exception_on_overflow=False)
+
+def analyze_frames(frames: np.ndarray):
+    N = frames.shape[-1]
     df = fs / N
     Npos = N // 2
     f = df * np.arange(Npos)
     w = np.hanning(N)
-    X = np.fft.fft(w * audio_data)
-    Xpos = np.sqrt(np.mean(w ** 2)) * np.abs(2 * X[:Npos]) / N
-    XdB = 20 * np.log10(Xpos)
-   
-    max_idx = np.argmax(XdB) 
-    max_freq = f[max_idx]
-    
-    XdB_normalized = (XdB - np.min(XdB)) / (np.max(XdB) - np.min(XdB))
-    
-    return get_closest_note(max_freq), max_freq, (f, XdB_normalized)
-
-def create_audio_stream():
+    X = np.fft.rfft(w * frames, axis=-1)
+    Xpos = np.sqrt(np.mean(w ** 2)) * np.abs(2 * X[..., :Npos]) / N
+    XdB = 20 * np.log10(np.maximum(Xpos, np.finfo(float).tiny))
+
+    max_idx = np.argmax(XdB, axis=-1)
+    max_freqs = f[max_idx]
+
+    power = Xpos ** 2
+    flatness = spectral_flatness(power)
+    bins = np.arange(Npos)
+    peak_mask = np.abs(bins - max_idx[..., None]) <= PEAK_BINS
+    total = np.sum(power, axis=-1)
+    confidences = np.divide(np.sum(power * peak_mask, axis=-1), total,
+                            out=np.zeros_like(total), where=total > 0)
+
+    XdB_min = np.min(XdB, axis=-1, keepdims=True)
+    XdB_range = np.max(XdB, axis=-1, keepdims=True) - XdB_min
+    XdB_normalized = np.divide(XdB - XdB_min, XdB_range,
+                               out=np.zeros_like(XdB), where=XdB_range > 0)
+
+    return f, max_freqs, confidences, flatness, XdB_normalized
+
+def detect_pitch(stream, vad=None, xruns=None):
+    vad = vad if vad is not None else get_default_vad(1)
+    data = read_input(stream, CHUNK, xruns)
+    audio_data = np.frombuffer(data, dtype=np.int16)[None, :]
+
+    if not vad.update(audio_data)[0]:
+        return None, None, None
+
+    f, max_freqs, _, flatness, XdB_normalized = analyze_frames(audio_data.astype(float))
+    if not vad.confirm(flatness)[0]:
+        return None, None, None
+    max_freq = max_freqs[0]
+
+    return get_closest_note(max_freq), max_freq, (f, XdB_normalized[0])
+
+def detect_pitch_multi_resolution(stream, detector, vad=None, xruns=None):
+    vad = vad if vad is not None else get_default_vad(1)
+    data = read_input(stream, detector.hop, xruns)
+    audio_data = np.frombuffer(data, dtype=np.int16)
+
+    # Every hop goes into the detector's ring so the long windows stay
+    # continuous across silent gaps; only the FFTs are skipped.
+    if not vad.update(audio_data[None, :])[0]:
+        detector.write(audio_data.astype(float))
+        return None, None, None
+
+    result = detector.push(audio_data)[-1]
+    if not vad.confirm([result["flatness"]])[0]:
+        return None, None, None
+
+    return result["note"], result["freq"], result["spectrum"]
+
+def detect_pitch_multichannel(stream, channels=CHANNELS, vad=None, xruns=None):
+    vad = vad if vad is not None else get_default_vad(channels)
+    data = read_input(stream, CHUNK, xruns)
+    audio_data = np.frombuffer(data, dtype=np.int16).reshape(-1, channels).T
+
+    results = [(None, None, 0.0)] * channels
+    active = np.flatnonzero(vad.update(audio_data))
+    if len(active) == 0:
+        return results
+
+    _, max_freqs, confidences, flatness, _ = analyze_frames(audio_data[active].astype(float))
+    voiced = vad.confirm(flatness, active)
+    for channel, freq, confidence, is_voiced in zip(active, max_freqs, confidences, voiced):
+        if is_voiced:
+            results[channel] = (get_closest_note(freq), freq, confidence)
+    return results
+
+def create_audio_stream(channels=CHANNELS):
     p = pyaudio.PyAudio()
     return p.open(
         format=FORMAT,
-        channels=CHANNELS,
+        channels=channels,
         rate=fs,
         input=True,
         frames_per_buffer=CHUNK
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,121 @@
+import functools
+import numpy as np
+from models.effect_graph import EffectGraph, ShiftNode
+from utils.audio_io import AudioSink
+
+FADE = 2048
+
+def slice_curve(value, first_frame: int):
+    # Per-frame curves (e.g. key-aware harmony shifts) are indexed from the
+    # start of whatever is streamed, so a region starting at first_frame
+    # reads them from there; the last value is held past the end.
+    if np.ndim(value) == 0:
+        return value
+    value = np.asarray(value)
+    return value[min(first_frame, len(value) - 1):]
+
+def crossfade(outgoing, incoming):
+    # Where the two renders agree (unchanged input, same phases) a fade
+    # summing to one keeps the level; where their phases differ the gains
+    # are raised towards equal power. The correlation over the fade picks
+    # the point in between.
+    fade = outgoing.shape[-1]
+    fade_in = np.sin(0.5 * np.pi * (np.arange(fade) + 0.5) / fade) ** 2
+    fade_out = 1 - fade_in
+    energy = np.sqrt(np.sum(outgoing ** 2) * np.sum(incoming ** 2))
+    correlation = np.clip(np.sum(outgoing * incoming) / energy, 0, 1) if energy > 0 else 1.0
+    gain = 1 / np.sqrt(fade_out ** 2 + fade_in ** 2 + 2 * correlation * fade_out * fade_in)
+    return (outgoing * fade_out + incoming * fade_in) * gain
+
+def shift_graph(shifter, semitones):
+    return EffectGraph([("out", ShiftNode(shifter, semitones), ["source"])], "out")
+
+class RegionRender:
+    # Keeps a rendered take and, after an edit to [start, end) of the input
+    # or its parameters, re-renders only the analysis frames around the edit.
+    # The region starts on a frame boundary, so its frames and time mapping
+    # line up with the full render. It is started `margin` samples early and
+    # ends late, and both warm-up stretches are thrown away. The new samples
+    # replace the cached ones through a crossfade. The vocoder's phases
+    # restart in the region, so away from 0 semitones the two renders differ
+    # in phase even where the input did not change, and onsets inside the
+    # region can land up to about 120 samples from where a full render puts
+    # them (measured at +5 semitones).
+    def __init__(self, make_graph, hop: int, margin: int, fade: int = FADE, **params):
+        self.make_graph = make_graph
+        self.hop = hop
+        self.margin = margin
+        self.fade = fade
+        self.params = params
+        self.output = None
+        self.length = 0
+        self.channels = 0
+
+    @classmethod
+    def for_shift(cls, shifter, semitones, fade: int = FADE):
+        return cls(functools.partial(shift_graph, shifter), shifter.hop_len, 2 * shifter.w_len, fade,
+                   semitones=semitones)
+
+    @classmethod
+    def for_preset(cls, preset, shifter, rate, fade: int = FADE, **params):
+        return cls(functools.partial(EffectGraph.from_preset, preset, shifter, rate), shifter.hop_len,
+                   2 * shifter.w_len, fade, **params)
+
+    def graph(self, first_frame: int = 0):
+        return self.make_graph(**{name: slice_curve(value, first_frame) for name, value in self.params.items()})
+
+    def render(self, y):
+        y = np.atleast_2d(y)
+        self.output = self.graph().render(y)
+        self.length = y.shape[-1]
+        self.channels = y.shape[0]
+        return self.output
+
+    def update(self, y, start: int, end: int, **params):
+        # y is the whole edited take. Samples outside [start, end) must be
+        # unchanged, except that the take may grow or shrink at the end
+        # (end == len(y)). New parameter values replace the old ones for the
+        # region; curves should only differ inside it.
+        y = np.atleast_2d(y)
+        self.params.update(params)
+        n = y.shape[-1]
+        if self.output is None or y.shape[0] != self.channels:
+            return self.render(y)
+        if n != self.length and end < n:
+            raise ValueError("Only the end of a take can change its length")
+
+        start, end = max(start, 0), min(end, n)
+        tail = self.graph().tail_length()
+        margin, fade = self.margin, self.fade
+        first = max(start - 2 * margin - fade, 0) // self.hop * self.hop
+        last = end + 2 * margin + tail + fade
+        final = last >= n
+        region = self.graph(first // self.hop).render(y[:, first:min(last, n)])
+        old = self.output
+
+        pieces = []
+        fresh = 0
+        if first > 0:
+            lo = start - margin - fade
+            pieces += [old[:, :lo], crossfade(old[:, lo:lo + fade], region[:, lo - first:lo - first + fade])]
+            fresh = lo + fade
+        if final:
+            # The region's own frame and resampler rounding would leave the
+            # end a few hundred samples off; match a full render's length.
+            tail_piece = region[:, fresh - first:]
+            missing = self.graph().output_length(n) - fresh - tail_piece.shape[-1]
+            if missing < 0:
+                tail_piece = tail_piece[:, :missing]
+            pieces += [tail_piece, np.zeros((tail_piece.shape[0], max(missing, 0)), dtype=tail_piece.dtype)]
+        else:
+            hi = end + margin + tail
+            pieces += [region[:, fresh - first:hi - first],
+                       crossfade(region[:, hi - first:hi - first + fade], old[:, hi:hi + fade]),
+                       old[:, hi + fade:]]
+        self.output = np.concatenate(pieces, axis=-1).astype(np.float32, copy=False)
+        self.length = n
+        return self.output
+
+    def save(self, output_file: str, rate: int):
+        with AudioSink(output_file, rate, self.output.shape[0]) as sink:
+            sink.write(np.clip(self.output, -1, 1).T)
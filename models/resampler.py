@@ -0,0 +1,158 @@
+import functools
+from fractions import Fraction
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+HALF_TAPS = 16
+KAISER_BETA = 8.6
+ROLLOFF = 0.94
+MAX_DENOMINATOR = 512
+FRACTIONAL_PHASES = 256
+OUTPUT_BLOCK = 1 << 12
+
+def rational_ratio(ratio: float, max_denominator: int = MAX_DENOMINATOR):
+    fraction = Fraction(ratio).limit_denominator(max_denominator)
+    return fraction.numerator, fraction.denominator
+
+@functools.lru_cache(maxsize=64)
+def filter_bank(up: int, down: int, half_taps: int = HALF_TAPS):
+    # Kaiser-windowed sinc designed at the upsampled rate, split into `up`
+    # phases of `taps` coefficients each. Phase p of output sample m is
+    # (m * down + delay) % up, so each output is one short dot product.
+    taps = 2 * int(np.ceil(half_taps * max(1.0, down / up)))
+    length = up * taps - 1
+    delay = (length - 1) // 2
+    cutoff = ROLLOFF / max(up, down)
+    n = np.arange(length) - delay
+    h = up * cutoff * np.sinc(cutoff * n) * np.kaiser(length, KAISER_BETA)
+    bank = np.append(h, 0.0).reshape(taps, up).T
+    bank = np.ascontiguousarray(bank[:, ::-1])
+    bank.setflags(write=False)
+    return bank, delay
+
+class PolyphaseResampler:
+    def __init__(self, up: int, down: int, half_taps: int = HALF_TAPS):
+        self.up = up
+        self.down = down
+        self.bank, self.delay = filter_bank(up, down, half_taps)
+        self.taps = self.bank.shape[1]
+        self.history = None
+        self.total_in = 0
+        self.next_out = 0
+
+    @classmethod
+    def for_ratio(cls, ratio: float, max_denominator: int = MAX_DENOMINATOR):
+        return cls(*rational_ratio(ratio, max_denominator))
+
+    def reset(self):
+        self.history = None
+        self.total_in = 0
+        self.next_out = 0
+
+    def run(self, block: np.ndarray, limit: int = None):
+        if self.history is None:
+            self.history = np.zeros(block.shape[:-1] + (self.taps,))
+        buffer = np.concatenate((self.history, block), axis=-1)
+        base = self.total_in - self.taps
+        self.total_in += block.shape[-1]
+
+        last = (self.total_in * self.up - 1 - self.delay) // self.down
+        if limit is not None:
+            last = min(last, limit - 1)
+        windows = sliding_window_view(buffer, self.taps, axis=-1)
+        outputs = []
+        for first in range(self.next_out, last + 1, OUTPUT_BLOCK):
+            m = np.arange(first, min(first + OUTPUT_BLOCK, last + 1))
+            n = m * self.down + self.delay
+            rows = n // self.up - self.taps + 1 - base
+            outputs.append(np.einsum("...mk,mk->...m", windows[..., rows, :], self.bank[n % self.up]))
+        self.next_out = max(self.next_out, last + 1)
+        self.history = buffer[..., -self.taps:]
+        return np.concatenate(outputs, axis=-1) if outputs else buffer[..., :0]
+
+    def process(self, block: np.ndarray):
+        return self.run(np.asarray(block, dtype=float))
+
+    def flush(self):
+        if self.history is None:
+            return np.zeros(0)
+        target = -(-self.total_in * self.up // self.down)
+        return self.run(np.zeros(self.history.shape[:-1] + (self.taps,)), limit=target)
+
+    def resample(self, x: np.ndarray):
+        self.reset()
+        out = np.concatenate((self.process(x), self.flush()), axis=-1)
+        self.reset()
+        return out
+
+def resample(x: np.ndarray, ratio: float, max_denominator: int = MAX_DENOMINATOR):
+    return PolyphaseResampler.for_ratio(ratio, max_denominator).resample(x)
+
+def resample_at(x: np.ndarray, positions: np.ndarray, max_step: float = 1.0, half_taps: int = HALF_TAPS):
+    # Band-limited reads of x at arbitrary fractional sample positions, e.g.
+    # for a time-varying ratio. The cached bank is used as a fine fractional
+    # delay table and adjacent phases are blended linearly. max_step is the
+    # largest position increment, which sets the anti-aliasing cutoff.
+    up = FRACTIONAL_PHASES
+    down = max(up, int(np.ceil(up * max_step)))
+    bank, delay = filter_bank(up, down, half_taps)
+    taps = bank.shape[1]
+    padded = np.concatenate((np.zeros(x.shape[:-1] + (taps,)), x, np.zeros(x.shape[:-1] + (taps,))), axis=-1)
+    windows = sliding_window_view(padded, taps, axis=-1)
+
+    outputs = []
+    for first in range(0, len(positions), OUTPUT_BLOCK):
+        exact = positions[first:first + OUTPUT_BLOCK] * up + delay
+        n = np.floor(exact).astype(int)
+        frac = exact - n
+        out = 0
+        for offset, weight in ((0, 1 - frac), (1, frac)):
+            rows = np.clip((n + offset) // up + 1, 0, windows.shape[-2] - 1)
+            out = out + weight * np.einsum("...mk,mk->...m", windows[..., rows, :], bank[(n + offset) % up])
+        outputs.append(out)
+    return np.concatenate(outputs, axis=-1) if outputs else x[..., :0]
+
+class VariableResampler:
+    # Streaming counterpart of resample_at: read positions (absolute, in
+    # input samples, increasing) are queued with extend() and answered as
+    # soon as enough input has arrived around them.
+    def __init__(self, max_step: float = 1.0, half_taps: int = HALF_TAPS):
+        self.max_step = max_step
+        self.half_taps = half_taps
+        up = FRACTIONAL_PHASES
+        self.taps = filter_bank(up, max(up, int(np.ceil(up * max_step))), half_taps)[0].shape[1]
+        self.reset()
+
+    def reset(self):
+        self.buffer = None
+        self.base = 0
+        self.last = 0.0
+        self.positions = np.zeros(0)
+
+    def extend(self, positions: np.ndarray):
+        self.positions = np.concatenate((self.positions, positions))
+
+    def run(self, final: bool):
+        if self.buffer is None:
+            return np.zeros(0)
+        end = self.base + self.buffer.shape[-1]
+        ready = len(self.positions) if final else int(np.searchsorted(self.positions, end - self.taps))
+        out = resample_at(self.buffer, self.positions[:ready] - self.base, self.max_step, self.half_taps)
+        if ready:
+            self.last = self.positions[ready - 1]
+        self.positions = self.positions[ready:]
+
+        # Keep one filter length of history before the next position to read.
+        anchor = self.positions[0] if len(self.positions) else self.last
+        keep = int(np.clip(np.floor(anchor) - self.taps - self.base, 0, self.buffer.shape[-1]))
+        self.buffer = self.buffer[..., keep:]
+        self.base += keep
+        return out
+
+    def process(self, block: np.ndarray):
+        block = np.asarray(block, dtype=float)
+        self.buffer = block if self.buffer is None else np.concatenate((self.buffer, block), axis=-1)
+        return self.run(final=False)
+
+    def flush(self):
+        return self.run(final=True)
@@ -0,0 +1,78 @@
+import numpy as np
+
+FULL_SCALE = 32768.0
+INITIAL_FLOOR_DB = -60.0
+MIN_FLOOR_DB = -100.0
+OPEN_MARGIN_DB = 12.0
+CLOSE_MARGIN_DB = 6.0
+FLOOR_FALL = 0.3
+FLOOR_RISE_DB = 0.3
+FLOOR_RISE_ACTIVE_DB = 0.02
+FLATNESS_OPEN = 0.35
+FLATNESS_CLOSE = 0.5
+HANGOVER_FRAMES = 2
+
+def rms_db(frames: np.ndarray):
+    rms = np.sqrt(np.mean(np.square(frames, dtype=float), axis=-1))
+    return 20 * np.log10(np.maximum(rms / FULL_SCALE, 10 ** (MIN_FLOOR_DB / 20)))
+
+def spectral_flatness(power: np.ndarray):
+    power = np.maximum(power, np.finfo(float).tiny)
+    return np.exp(np.mean(np.log(power), axis=-1)) / np.mean(power, axis=-1)
+
+class VoiceActivityDetector:
+    def __init__(self, channels=1):
+        self.channels = channels
+        self.noise_floor = np.full(channels, INITIAL_FLOOR_DB)
+        self.active = np.zeros(channels, dtype=bool)
+        self.voiced = np.zeros(channels, dtype=bool)
+        self.hangover = np.zeros(channels, dtype=int)
+        self.level = np.full(channels, MIN_FLOOR_DB)
+        self.analysed_frames = 0
+        self.skipped_frames = 0
+        self.rejected_frames = 0
+
+    def reset(self):
+        self.__init__(self.channels)
+
+    def update(self, frames: np.ndarray):
+        # frames is (channels, samples). Cheap RMS gate with hysteresis over
+        # an adaptive noise floor; only channels that pass need an FFT.
+        level = rms_db(frames)
+        margin = np.where(self.active, CLOSE_MARGIN_DB, OPEN_MARGIN_DB)
+        loud = level > self.noise_floor + margin
+
+        self.hangover = np.where(loud, HANGOVER_FRAMES, np.maximum(self.hangover - 1, 0))
+        self.active = loud | (self.active & (self.hangover > 0))
+
+        falling = level < self.noise_floor
+        rise = np.where(self.active, FLOOR_RISE_ACTIVE_DB, FLOOR_RISE_DB)
+        self.noise_floor = np.where(falling,
+                                    self.noise_floor + FLOOR_FALL * (level - self.noise_floor),
+                                    self.noise_floor + np.minimum(level - self.noise_floor, rise))
+        self.level = level
+        self.voiced &= self.active
+
+        analysed = int(np.count_nonzero(self.active))
+        self.analysed_frames += analysed
+        self.skipped_frames += self.channels - analysed
+        return self.active.copy()
+
+    def confirm(self, flatness: np.ndarray, channels=None):
+        # Noise-like spectra (high flatness) that got past the level gate are
+        # rejected and pull the noise floor up to the current level, so a
+        # steady fan or hiss stops opening the gate.
+        channels = np.flatnonzero(self.active) if channels is None else np.asarray(channels)
+        threshold = np.where(self.voiced[channels], FLATNESS_CLOSE, FLATNESS_OPEN)
+        noisy = np.asarray(flatness) > threshold
+        rejected = channels[noisy]
+        self.voiced[channels] = ~noisy
+        self.active[rejected] = False
+        self.hangover[rejected] = 0
+        self.noise_floor[rejected] = np.maximum(self.noise_floor[rejected], self.level[rejected] - CLOSE_MARGIN_DB)
+        self.rejected_frames += len(rejected)
+        return ~noisy
+
+    def stats(self):
+        return {"analysed": self.analysed_frames, "skipped": self.skipped_frames, "rejected": self.rejected_frames,
+                "noise_floor_db": self.noise_floor.tolist()}
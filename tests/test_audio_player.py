@@ -0,0 +1,85 @@
+import threading
+import numpy as np
+import pytest
+
+pytest.importorskip("pyaudio")
+from utils.audio_player import PlaybackEngine, NullBackend
+
+BLOCK = 64
+
+class RenderOnRelease:
+    # Stands in for the engine lock and lets the audio callback render one
+    # block the next time the lock is released, as a real device might.
+    def __init__(self, engine):
+        self.lock = threading.Lock()
+        self.engine = engine
+        self.armed = False
+        self.rendered = []
+
+    def __enter__(self):
+        self.lock.acquire()
+
+    def __exit__(self, *exc):
+        self.lock.release()
+        if self.armed:
+            self.armed = False
+            self.rendered.append(self.engine.backend.pump(BLOCK))
+
+def make_engine(channels=1):
+    engine = PlaybackEngine(NullBackend(), channels=channels, block=BLOCK)
+    engine.start()
+    return engine
+
+def test_voices_are_summed():
+    engine = make_engine()
+    engine.play(np.full(100, 0.25))
+    engine.play(np.full(50, 0.5))
+    out = engine.backend.pump(BLOCK)[:, 0]
+    assert np.allclose(out[:50], 0.75)
+    assert np.allclose(out[50:64], 0.25)
+
+def test_mono_engine_mixes_stereo_down():
+    engine = make_engine()
+    engine.play(np.stack((np.full(BLOCK, 0.2), np.full(BLOCK, 0.6)), axis=1))
+    assert np.allclose(engine.backend.pump(BLOCK), 0.4)
+
+def test_unmappable_layout_is_rejected():
+    engine = make_engine(channels=2)
+    with pytest.raises(ValueError):
+        engine.play(np.zeros((BLOCK, 6)))
+
+def test_stop_fades_out_then_removes_voice():
+    engine = make_engine()
+    voice_id = engine.play(np.ones(1000))
+    engine.backend.pump(BLOCK)
+    engine.stop(voice_id, fade_out=32)
+    out = engine.backend.pump(BLOCK)[:, 0]
+    assert np.allclose(out[:32], 1 - np.arange(32) / 32)
+    assert np.all(out[32:] == 0)
+    assert not engine.is_playing(voice_id)
+
+def test_crossfade_keeps_position_when_a_block_renders_meanwhile():
+    engine = make_engine()
+    data = np.arange(2000) / 2000
+    lock = RenderOnRelease(engine)
+    engine.lock = lock
+    voice_id = engine.play(data)
+    played = [engine.backend.pump(BLOCK)]
+    lock.armed = True
+    engine.crossfade(voice_id, data, frames=BLOCK)
+    played += lock.rendered + [engine.backend.pump(BLOCK) for _ in range(3)]
+    # Same material at the same position: the two fades sum to one.
+    out = np.concatenate(played)[:, 0]
+    assert np.allclose(out, data[:len(out)], atol=1e-6)
+
+def test_stream_underruns_are_counted():
+    engine = make_engine()
+    voice_id = engine.open_stream(prebuffer=BLOCK)
+    engine.feed(voice_id, np.ones(BLOCK + BLOCK // 2))
+    engine.backend.pump(BLOCK)
+    engine.backend.pump(BLOCK)
+    assert engine.underruns()["stream"] == 1
+    engine.finish(voice_id)
+    engine.backend.pump(BLOCK)
+    assert not engine.is_playing(voice_id)
+    assert engine.underruns() == {"stream": 1, "device": 0}
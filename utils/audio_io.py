@@ -0,0 +1,87 @@
+import os
+import queue
+import threading
+import numpy as np
+import soundfile as sf
+
+BLOCK_SIZE = 4096
+SINK_QUEUE_BLOCKS = 256
+FORMATS = {
+    ".wav": ("WAV", "PCM_16"),
+    ".flac": ("FLAC", "PCM_16"),
+    ".ogg": ("OGG", "VORBIS"),
+}
+
+def file_blocks(path: str, block_size: int = BLOCK_SIZE):
+    # Decodes one block at a time, so long recordings never have to be
+    # loaded whole. Blocks are (channels, samples) float32.
+    for block in sf.blocks(path, blocksize=block_size, dtype="float32", always_2d=True):
+        yield block.T
+
+def read_audio(path: str, max_seconds: float = None, dtype="float32"):
+    # Only the first max_seconds are decoded when given.
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    with sf.SoundFile(path) as f:
+        frames = -1 if max_seconds is None else int(max_seconds * f.samplerate)
+        return f.read(frames, dtype=dtype), f.samplerate
+
+class AudioSink:
+    # Encodes on a background thread: write() only queues the block, so the
+    # capture or render loop never waits on the encoder or the disk. The file
+    # is written under a temporary name and moved into place by close().
+    def __init__(self, path: str, rate: int, channels: int = 1, subtype: str = None,
+                 queue_blocks: int = SINK_QUEUE_BLOCKS):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise ValueError(f"Unsupported audio format: {extension}")
+        file_format, default_subtype = FORMATS[extension]
+        self.path = path
+        self.partial_path = path + ".part"
+        self.channels = channels
+        self.file = sf.SoundFile(self.partial_path, "w", samplerate=rate, channels=channels,
+                                 format=file_format, subtype=subtype or default_subtype)
+        self.queue = queue.Queue(queue_blocks)
+        self.frames = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        # pyaudio bytes (int16), or int16/float arrays shaped (frames,) or
+        # (frames, channels).
+        if isinstance(data, (bytes, bytearray)):
+            data = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+        self.queue.put(np.asarray(data))
+
+    def run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.file.write(data)
+                self.frames += len(data)
+            except Exception as e:
+                print(f"Error writing {self.path}: {e}")
+                self.error = e
+        self.file.close()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.error is None:
+            os.replace(self.partial_path, self.path)
+        elif os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,292 @@
+import collections
+import itertools
+import threading
+import time
+import numpy as np
+import pyaudio
+import soundfile as sf
+
+PLAYBACK_RATE = 44100
+PLAYBACK_CHANNELS = 2
+PLAYBACK_BLOCK = 512
+STOP_FADE = 441
+RENDER_AHEAD = 11025
+
+class Voice:
+    def __init__(self, data, start, offset=0, gain=1.0):
+        self.data = data
+        self.start = start
+        self.offset = offset
+        self.gain = gain
+        self.fade_start = start
+        self.fade_len = 0
+        self.fade_from = gain
+        self.fade_to = gain
+        self.end = start + len(data) - offset
+
+    def set_fade(self, frame, length, target):
+        self.fade_from = self.gain_at(frame)
+        self.fade_start = frame
+        self.fade_len = length
+        self.fade_to = target
+
+    def gain_at(self, frames):
+        if self.fade_len == 0:
+            progress = np.asarray(frames) >= self.fade_start
+        else:
+            progress = np.clip((np.asarray(frames) - self.fade_start) / self.fade_len, 0, 1)
+        return self.fade_from + (self.fade_to - self.fade_from) * progress
+
+    def position(self, frame):
+        return min(max(frame - self.start, 0) + self.offset, len(self.data))
+
+    def duration(self):
+        return len(self.data)
+
+    def mix(self, out, block_start):
+        block_end = block_start + len(out)
+        begin = max(self.start, block_start)
+        end = min(self.end, block_end)
+        if end > begin:
+            src = self.offset + begin - self.start
+            gain = self.gain_at(np.arange(begin, end))[:, None]
+            out[begin - block_start:end - block_start] += self.data[src:src + end - begin] * gain
+        return self.end <= block_end
+
+class StreamVoice(Voice):
+    def __init__(self, channels, start, prebuffer, gain=1.0, requested_at=None):
+        super().__init__(np.zeros((0, channels), dtype=np.float32), start, gain=gain)
+        self.blocks = collections.deque()
+        self.buffered = 0
+        self.played = 0
+        self.prebuffer = prebuffer
+        self.started = False
+        self.finished = False
+        self.end = float("inf")
+        self.underruns = 0
+        self.requested_at = time.perf_counter() if requested_at is None else requested_at
+        self.time_to_first_sound = None
+
+    def feed(self, data):
+        self.blocks.append(data)
+        self.buffered += len(data)
+
+    def position(self, frame):
+        return self.played
+
+    def duration(self):
+        return self.played + self.buffered
+
+    def mix(self, out, block_start):
+        block_end = block_start + len(out)
+        if not self.started:
+            if self.buffered < self.prebuffer and not self.finished:
+                return False
+            self.started = True
+            self.start = block_start
+
+        gain = self.gain_at(np.arange(block_start, block_end))[:, None]
+        filled = 0
+        while filled < len(out) and self.blocks:
+            block = self.blocks[0]
+            take = min(len(block), len(out) - filled)
+            out[filled:filled + take] += block[:take] * gain[filled:filled + take]
+            if take == len(block):
+                self.blocks.popleft()
+            else:
+                self.blocks[0] = block[take:]
+            filled += take
+        self.buffered -= filled
+        self.played += filled
+
+        if filled and self.time_to_first_sound is None:
+            self.time_to_first_sound = time.perf_counter() - self.requested_at
+        if filled < len(out) and not self.finished:
+            self.underruns += 1
+        return (self.finished and not self.blocks) or self.end <= block_end
+
+class NullBackend:
+    def __init__(self):
+        self.engine = None
+
+    def start(self, engine):
+        self.engine = engine
+
+    def pump(self, frames):
+        return self.engine.render(frames)
+
+    def stop(self):
+        self.engine = None
+
+class PyAudioBackend:
+    def __init__(self):
+        self.audio = None
+        self.stream = None
+
+    def start(self, engine):
+        def callback(in_data, frame_count, time_info, status):
+            # The device ran dry before this callback: the previous one
+            # returned too late.
+            if status & pyaudio.paOutputUnderflow:
+                engine.device_underflows += 1
+            return engine.render(frame_count).tobytes(), pyaudio.paContinue
+
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paFloat32, channels=engine.channels, rate=engine.rate,
+                                      output=True, frames_per_buffer=engine.block, stream_callback=callback)
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.audio:
+            self.audio.terminate()
+            self.audio = None
+
+class PlaybackEngine:
+    def __init__(self, backend=None, rate=PLAYBACK_RATE, channels=PLAYBACK_CHANNELS, block=PLAYBACK_BLOCK):
+        self.backend = backend if backend is not None else PyAudioBackend()
+        self.rate = rate
+        self.channels = channels
+        self.block = block
+        self.frame = 0
+        self.voices = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.device_underflows = 0
+        self.stream_underruns = 0
+
+    def start(self):
+        self.backend.start(self)
+
+    def close(self):
+        self.backend.stop()
+        with self.lock:
+            self.voices.clear()
+
+    def as_buffer(self, data):
+        data = np.asarray(data)
+        if data.dtype == np.int16:
+            data = data / 32768.0
+        data = data.astype(np.float32)
+        if data.ndim == 1:
+            data = data[:, None]
+        if data.shape[1] != self.channels:
+            # Mono is spread over every output channel and anything else is
+            # mixed down to mono first; other layouts have no obvious mapping.
+            if data.shape[1] > 1 and self.channels > 1:
+                raise ValueError(f"Cannot play {data.shape[1]} channels on a {self.channels}-channel engine")
+            data = np.repeat(data.mean(axis=1, keepdims=True), self.channels, axis=1)
+        return data
+
+    def load(self, path):
+        data, rate = sf.read(path, dtype="float32", always_2d=True)
+        if rate != self.rate:
+            raise ValueError(f"{path} is {rate} Hz, playback runs at {self.rate} Hz")
+        return self.as_buffer(data)
+
+    def add_voice(self, buffer, start, gain, offset, fade_in):
+        # Caller holds self.lock.
+        voice = Voice(buffer, start, offset, gain)
+        if fade_in:
+            voice.fade_from = 0.0
+            voice.fade_len = fade_in
+        voice_id = next(self.ids)
+        self.voices[voice_id] = voice
+        return voice_id
+
+    def fade_voice(self, voice_id, fade_out):
+        # Caller holds self.lock.
+        voice = self.voices.get(voice_id)
+        if voice is None:
+            return
+        if fade_out <= 0 or self.frame < voice.start:
+            del self.voices[voice_id]
+            return
+        voice.set_fade(self.frame, fade_out, 0.0)
+        voice.end = min(voice.end, self.frame + fade_out)
+
+    def play(self, data, at=None, gain=1.0, offset=0, fade_in=0):
+        buffer = self.as_buffer(data)
+        with self.lock:
+            start = self.frame if at is None else max(at, self.frame)
+            return self.add_voice(buffer, start, gain, offset, fade_in)
+
+    def stop(self, voice_id, fade_out=STOP_FADE):
+        with self.lock:
+            self.fade_voice(voice_id, fade_out)
+
+    def stop_all(self, fade_out=STOP_FADE):
+        for voice_id in list(self.voices):
+            self.stop(voice_id, fade_out)
+
+    def open_stream(self, prebuffer=RENDER_AHEAD, gain=1.0, requested_at=None):
+        with self.lock:
+            voice_id = next(self.ids)
+            self.voices[voice_id] = StreamVoice(self.channels, self.frame, prebuffer, gain, requested_at)
+        return voice_id
+
+    def feed(self, voice_id, data):
+        buffer = self.as_buffer(data)
+        with self.lock:
+            voice = self.voices.get(voice_id)
+            if voice is None:
+                return False
+            voice.feed(buffer)
+        return True
+
+    def finish(self, voice_id):
+        with self.lock:
+            voice = self.voices.get(voice_id)
+            if voice is not None:
+                voice.finished = True
+
+    def stream_stats(self, voice_id):
+        voice = self.voices.get(voice_id)
+        if not isinstance(voice, StreamVoice):
+            return None
+        return {"time_to_first_sound": voice.time_to_first_sound, "underruns": voice.underruns,
+                "buffered": voice.buffered / self.rate}
+
+    def crossfade(self, voice_id, data, frames, keep_position=True, gain=1.0):
+        # Reading the old position, starting the new voice and fading the
+        # old one happen in one critical section, so no block is rendered in
+        # between and both fades start on the same frame.
+        buffer = self.as_buffer(data)
+        with self.lock:
+            voice = self.voices.get(voice_id)
+            offset = voice.position(self.frame) if voice is not None and keep_position else 0
+            new_id = self.add_voice(buffer, self.frame, gain, offset, frames)
+            self.fade_voice(voice_id, frames)
+        return new_id
+
+    def underruns(self):
+        # Blocks where a stream voice had nothing queued (its producer fell
+        # behind), over finished and playing voices, and device underflows
+        # reported by the backend.
+        with self.lock:
+            playing = sum(getattr(voice, "underruns", 0) for voice in self.voices.values())
+            return {"stream": self.stream_underruns + playing, "device": self.device_underflows}
+
+    def is_playing(self, voice_id):
+        return voice_id in self.voices
+
+    def position(self, voice_id):
+        voice = self.voices.get(voice_id)
+        if voice is None:
+            return None
+        return voice.position(self.frame) / self.rate, voice.duration() / self.rate
+
+    def render(self, frames):
+        out = np.zeros((frames, self.channels), dtype=np.float32)
+        with self.lock:
+            block_start = self.frame
+            block_end = block_start + frames
+            for voice_id, voice in list(self.voices.items()):
+                if voice.mix(out, block_start):
+                    self.stream_underruns += getattr(voice, "underruns", 0)
+                    del self.voices[voice_id]
+            self.frame = block_end
+        return out
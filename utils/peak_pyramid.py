@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import soundfile as sf
+from utils.audio_io import file_blocks
+
+BASE_BLOCK = 256
+INITIAL_CAPACITY = 1024
+PEAKS_SUFFIX = ".peaks.npz"
+
+def peaks_path(audio_path: str):
+    return audio_path + PEAKS_SUFFIX
+
+def source_stamp(audio_path: str):
+    stat = os.stat(audio_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+class PeakLevel:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.mins = np.empty(capacity, dtype=np.float32)
+        self.maxs = np.empty(capacity, dtype=np.float32)
+        self.count = 0
+
+    def extend(self, mins, maxs):
+        needed = self.count + len(mins)
+        if needed > len(self.mins):
+            capacity = max(needed, 2 * len(self.mins))
+            self.mins = np.concatenate((self.mins[:self.count], np.empty(capacity - self.count, dtype=np.float32)))
+            self.maxs = np.concatenate((self.maxs[:self.count], np.empty(capacity - self.count, dtype=np.float32)))
+        self.mins[self.count:needed] = mins
+        self.maxs[self.count:needed] = maxs
+        self.count = needed
+
+class PeakPyramid:
+    # Level k holds the min and max of every BASE_BLOCK * 2**k samples, so a
+    # view of any zoom reads at most about two bins per pixel from the
+    # level whose bins are just finer than a pixel.
+    def __init__(self, rate: int, base_block: int = BASE_BLOCK):
+        self.rate = rate
+        self.base_block = base_block
+        self.levels = [PeakLevel()]
+        self.total = 0
+        self.tail = np.zeros(0, dtype=np.float32)
+        self.tail_max = np.zeros(0, dtype=np.float32)
+
+    def push(self, level: int, mins, maxs):
+        current = self.levels[level]
+        current.extend(mins, maxs)
+        pairs = current.count // 2
+        if pairs == 0:
+            return
+        if level + 1 == len(self.levels):
+            self.levels.append(PeakLevel())
+        done = self.levels[level + 1].count
+        if pairs > done:
+            lo = current.mins[2 * done:2 * pairs].reshape(-1, 2).min(axis=1)
+            hi = current.maxs[2 * done:2 * pairs].reshape(-1, 2).max(axis=1)
+            self.push(level + 1, lo, hi)
+
+    def append(self, samples):
+        # samples are (n,) or (channels, n) floats in [-1, 1]; channels are
+        # folded together so the overview shows the loudest one.
+        samples = np.asarray(samples, dtype=np.float32)
+        lo = samples.min(axis=0) if samples.ndim > 1 else samples
+        hi = samples.max(axis=0) if samples.ndim > 1 else samples
+        lo = np.concatenate((self.tail, lo))
+        hi = np.concatenate((self.tail_max, hi))
+        full = len(lo) // self.base_block * self.base_block
+        if full:
+            self.push(0, lo[:full].reshape(-1, self.base_block).min(axis=1),
+                      hi[:full].reshape(-1, self.base_block).max(axis=1))
+        self.tail, self.tail_max = lo[full:], hi[full:]
+        self.total += samples.shape[-1]
+
+    def partial(self, level: int):
+        # Min/max of the samples after the last complete bin of `level`.
+        if level == 0:
+            if len(self.tail) == 0:
+                return None
+            return self.tail.min(), self.tail_max.max()
+        below = self.levels[level - 1]
+        start = 2 * self.levels[level].count if level < len(self.levels) else 0
+        parts = [(below.mins[start:below.count].min(), below.maxs[start:below.count].max())] \
+            if below.count > start else []
+        rest = self.partial(level - 1)
+        if rest is not None:
+            parts.append(rest)
+        if not parts:
+            return None
+        return min(p[0] for p in parts), max(p[1] for p in parts)
+
+    def peaks(self, start: int, end: int, width: int):
+        mins = np.full(width, np.nan, dtype=np.float32)
+        maxs = np.full(width, np.nan, dtype=np.float32)
+        if end <= start or self.total == 0:
+            return mins, maxs
+
+        samples_per_pixel = (end - start) / width
+        level = int(np.clip(np.floor(np.log2(max(samples_per_pixel / self.base_block, 1))), 0, len(self.levels) - 1))
+        size = self.base_block * 2 ** level
+        current = self.levels[level]
+        count = current.count
+        level_mins, level_maxs = current.mins[:count], current.maxs[:count]
+        extra = self.partial(level)
+        if extra is not None:
+            level_mins = np.append(level_mins, extra[0])
+            level_maxs = np.append(level_maxs, extra[1])
+
+        edges = start + (end - start) * np.arange(width) / width
+        visible = edges < self.total
+        bins = (edges[visible] // size).astype(int)
+        if len(bins) == 0:
+            return mins, maxs
+        first, last = bins[0], min(int(np.ceil(min(end, self.total) / size)), len(level_mins))
+        last = max(last, bins[-1] + 1)
+        lo = np.minimum.reduceat(level_mins[first:last], bins - first)
+        hi = np.maximum.reduceat(level_maxs[first:last], bins - first)
+        # A bin split by a pixel edge belongs to both pixels, so no peak
+        # drops out between them.
+        split = np.nonzero(edges[1:len(bins)] % size > 0)[0]
+        lo[split] = np.minimum(lo[split], level_mins[bins[split + 1]])
+        hi[split] = np.maximum(hi[split], level_maxs[bins[split + 1]])
+        mins[visible], maxs[visible] = lo, hi
+        return mins, maxs
+
+    def save(self, audio_path: str):
+        arrays = {"meta": np.array([self.rate, self.base_block, self.total], dtype=np.int64),
+                  "source": source_stamp(audio_path), "tail": self.tail, "tail_max": self.tail_max}
+        for k, level in enumerate(self.levels):
+            arrays[f"min{k}"] = level.mins[:level.count]
+            arrays[f"max{k}"] = level.maxs[:level.count]
+        path = peaks_path(audio_path)
+        partial_path = path + ".part"
+        with open(partial_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(partial_path, path)
+
+    @classmethod
+    def load(cls, audio_path: str):
+        path = peaks_path(audio_path)
+        if not os.path.exists(path) or not os.path.exists(audio_path):
+            return None
+        try:
+            with np.load(path) as data:
+                if not np.array_equal(data["source"], source_stamp(audio_path)):
+                    return None
+                rate, base_block, total = (int(v) for v in data["meta"])
+                pyramid = cls(rate, base_block)
+                pyramid.levels = []
+                k = 0
+                while f"min{k}" in data:
+                    level = PeakLevel(max(len(data[f"min{k}"]), 1))
+                    level.extend(data[f"min{k}"], data[f"max{k}"])
+                    pyramid.levels.append(level)
+                    k += 1
+                pyramid.tail, pyramid.tail_max = data["tail"], data["tail_max"]
+                pyramid.total = total
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable peak file {path}: {e}")
+            return None
+        return pyramid if pyramid.levels else None
+
+    @classmethod
+    def for_file(cls, audio_path: str):
+        pyramid = cls.load(audio_path)
+        if pyramid is None:
+            pyramid = cls(sf.info(audio_path).samplerate)
+            for block in file_blocks(audio_path, 1 << 16):
+                pyramid.append(block)
+            pyramid.save(audio_path)
+        return pyramid
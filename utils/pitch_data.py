@@ -1,3 +1,5 @@
+import numpy as np
+
 NOTE_FREQUENCIES = {
     "A0": 27.500, "A#0/Bb0": 29.1352, "B0": 30.8677, "C1": 32.7032, "C#1/Db1": 34.6478,
     "D1": 36.7081, "D#1/Eb1": 38.8909, "E1": 41.2034, "F1": 43.6535, "F#1/Gb1": 46.2493,
@@ -21,3 +23,66 @@ NOTE_FREQUENCIES = {
 
 def get_closest_note(freq):
     return min(NOTE_FREQUENCIES, key=lambda note: abs(NOTE_FREQUENCIES[note] - freq))
+
+# Notes sorted by frequency for vectorized lookups.
+NOTE_TABLE_NAMES = np.array(sorted(NOTE_FREQUENCIES, key=NOTE_FREQUENCIES.get), dtype=object)
+NOTE_TABLE_FREQS = np.array([NOTE_FREQUENCIES[note] for note in NOTE_TABLE_NAMES])
+
+def get_closest_notes(freqs):
+    # Array version of get_closest_note; NaN frequencies map to None.
+    freqs = np.asarray(freqs, dtype=float)
+    right = np.clip(np.searchsorted(NOTE_TABLE_FREQS, freqs), 1, len(NOTE_TABLE_FREQS) - 1)
+    left = right - 1
+    nearest = np.where(freqs - NOTE_TABLE_FREQS[left] <= NOTE_TABLE_FREQS[right] - freqs, left, right)
+    notes = NOTE_TABLE_NAMES[nearest]
+    notes[np.isnan(freqs)] = None
+    return notes
+
+def cents_from_note(freq, note):
+    return 1200 * np.log2(freq / NOTE_FREQUENCIES[note])
+
+SCALES = {
+    "major": [0, 2, 4, 5, 7, 9, 11],
+    "minor": [0, 2, 3, 5, 7, 8, 10],
+}
+
+def freq_to_midi(freq):
+    freq = np.asarray(freq, dtype=float)
+    with np.errstate(divide="ignore"):
+        return np.where(freq > 0, 69 + 12 * np.log2(np.maximum(freq, 1e-9) / 440.0), np.nan)
+
+def estimate_key(freqs):
+    midi = freq_to_midi(freqs)
+    pitch_classes = np.round(midi[~np.isnan(midi)]).astype(int) % 12
+    histogram = np.bincount(pitch_classes, minlength=12)
+    best = (0, "major", -1)
+    for scale, degrees in SCALES.items():
+        for tonic in range(12):
+            score = histogram[(tonic + np.array(degrees)) % 12].sum()
+            if score > best[2]:
+                best = (tonic, scale, score)
+    return best[0], best[1]
+
+def diatonic_shift_curve(freqs, tonic, steps, scale="major"):
+    # Semitone offsets that move each frame's note `steps` scale degrees up
+    # (or down), e.g. steps=2 for a diatonic third. Unvoiced frames hold the
+    # last voiced interval so the shift stays smooth through rests.
+    degrees = np.array(SCALES[scale])
+    midi = freq_to_midi(freqs)
+    voiced = ~np.isnan(midi)
+    notes = np.round(midi[voiced]).astype(int)
+
+    octave, pitch_class = np.divmod(notes - tonic, 12)
+    degree = np.searchsorted(degrees, pitch_class, side="right") - 1
+    target_octave, target_degree = np.divmod(degree + steps, len(degrees))
+    target = tonic + 12 * (octave + target_octave) + degrees[target_degree]
+
+    offsets = np.full(len(midi), np.nan)
+    offsets[voiced] = target - notes
+    fallback = degrees[steps % len(degrees)] + 12 * (steps // len(degrees))
+    if not np.any(voiced):
+        return np.full(len(midi), float(fallback))
+    first = np.argmax(voiced)
+    offsets[:first] = offsets[first]
+    held = np.maximum.accumulate(np.where(voiced, np.arange(len(midi)), 0))
+    return offsets[held]
@@ -0,0 +1,64 @@
+import time
+import numpy as np
+import pyaudio
+
+class ReplayStream:
+    def __init__(self, samples, rate=44100, channels=1, realtime=True, loop=True, buffer_frames=None):
+        samples = np.asarray(samples)
+        if samples.dtype != np.int16:
+            samples = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+        self.samples = samples.reshape(-1, channels)
+        self.rate = rate
+        self.channels = channels
+        self.realtime = realtime
+        self.loop = loop
+        # Like a device's input buffer: a reader that falls further behind
+        # than this loses the oldest frames and gets an overflow error.
+        self.buffer_frames = buffer_frames
+        self.overflowed = 0
+        self.position = 0
+        self.started_at = None
+        self.active = True
+
+    def start_stream(self):
+        self.active = True
+
+    def stop_stream(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+
+    def is_active(self):
+        return self.active
+
+    def capture_time(self, position):
+        # perf_counter time at which sample `position` reached the "mic".
+        return self.started_at + position / self.rate
+
+    def read(self, num_frames, exception_on_overflow=True):
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        if self.realtime and self.buffer_frames is not None:
+            waiting = int((time.perf_counter() - self.started_at) * self.rate) - self.position
+            if waiting > self.buffer_frames:
+                lost = waiting - self.buffer_frames
+                self.position += lost
+                self.overflowed += lost
+                if exception_on_overflow:
+                    raise OSError(pyaudio.paInputOverflowed, "Input overflowed")
+        if self.realtime:
+            due = self.started_at + (self.position + num_frames) / self.rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        total = len(self.samples)
+        if self.loop:
+            idx = (self.position + np.arange(num_frames)) % total
+            block = self.samples[idx]
+        else:
+            block = self.samples[self.position:self.position + num_frames]
+            block = np.concatenate((block, np.zeros((num_frames - len(block), self.channels), dtype=np.int16)))
+        self.position += num_frames
+        return block.tobytes()